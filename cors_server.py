@@ -1,10 +1,482 @@
-from http.server import SimpleHTTPRequestHandler, HTTPServer
+import email.utils
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import signal
+import sys
+import threading
+import urllib.parse
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from layer_index import LayerIndexes, parse_bbox
+from layer_store import ConflictError, LayerStores
+
+'''
+Local data server for the map apps.
+
+Serves the repository (run it from the root) on localhost port 8000 with CORS headers
+so the maps can load backend/data from file:// pages. Each request is handled on its
+own thread, so one slow client doesn't hold up the others.
+
+Files up to max_cached_size are read once into memory (backend/data is loaded at
+startup) along with compressed copies. The .gz and .br siblings written by
+utility/precompress.py are used when they're at least as new as the file; otherwise
+gzip (and brotli, if the module is installed) copies are made when the file is
+loaded, never per request. Files are re-read when they or their siblings change.
+Responses carry ETag and Last-Modified headers (so unchanged layers come back as
+304 Not Modified) and support single byte ranges.
+
+/query/<layer>?bbox=...&filter=... returns only the features of backend/data/<layer>.json
+that match (see layer_index.py for the syntax). Layers are indexed at startup and
+re-indexed when they change; recent query results are kept compressed in memory.
+
+The leaflet-map editor's routes are served too (run with port 3001 to stand in for
+backend/server.js), with saves going through the journaled store in layer_store.py:
+    GET  /get-layer-data/<id>     current layer, with its version in X-Layer-Version
+    POST /save-layers             {"id": ..., "data": FeatureCollection, "base_seq": optional}
+    POST /patch-layer             {"id": ..., "ops": [...], "base_seq": optional}
+Saves with a base_seq older than the layer's version get 409 Conflict. The layer
+files themselves catch up when the journal is compacted (and when the server stops);
+until then GETs of backend/data/<layer>.json and /query/<layer> are answered from the
+store, so they include every save.
+
+Usage:
+    python cors_server.py [port]
+'''
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+preload_dirs = [os.path.join('backend', 'data')]
+
+# Bigger files are streamed from disk by SimpleHTTPRequestHandler as before
+max_cached_size = 64 * 1024 * 1024
+
+compressible_types = ('text/', 'application/json', 'application/geo+json', 'application/javascript', 'image/svg+xml')
+
+# Mapbox and Leaflet both expect GeoJSON layers to be JSON
+mimetypes.add_type('application/geo+json', '.geojson')
+
+# Pre-compressed sibling files (see utility/precompress.py) for each content encoding
+sibling_suffixes = {'br': '.br', 'gzip': '.gz'}
+
+# A compressed file asked for by name is served as the archive it is, not as the
+# type it decompresses to (mimetypes says foo.json.gz is application/json)
+encoded_types = {'gzip': 'application/gzip', 'br': 'application/x-brotli', 'bzip2': 'application/x-bzip2', 'xz': 'application/x-xz'}
+
+def guess_content_type(path):
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding is not None:
+        return encoded_types.get(encoding, 'application/octet-stream')
+    return content_type or 'application/octet-stream'
+
+def file_stamp(path):
+    # Size and mtime of a file and its compressed siblings, to tell when any of them changed
+    stamp = []
+    for suffix in ('', *sibling_suffixes.values()):
+        try:
+            stat = os.stat(path + suffix)
+            stamp.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+class CachedFile:
+    def __init__(self, body, mtime, stamp, content_type, encodings=None):
+        self.body = body
+        self.size = len(body)
+        self.mtime = mtime # nanoseconds
+        self.stamp = stamp
+        self.content_type = content_type
+        self.last_modified = email.utils.formatdate(mtime / 1e9, usegmt=True)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+        self.encodings = dict(encodings or {})
+
+        # Compress once here (unless a pre-compressed copy was given), so requests only pick a copy
+        if self.content_type.startswith(compressible_types) and len(self.body) > 1024:
+            if 'gzip' not in self.encodings:
+                self.encodings['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if 'br' not in self.encodings and brotli is not None:
+                self.encodings['br'] = brotli.compress(self.body)
+
+    @classmethod
+    def load(cls, path, stat, stamp):
+        with open(path, 'rb') as f:
+            body = f.read()
+
+        # Use pre-compressed siblings that are up to date with the file
+        encodings = {}
+        for (encoding, suffix), sibling in zip(sibling_suffixes.items(), stamp[1:]):
+            if sibling is not None and sibling[1] >= stat.st_mtime_ns:
+                with open(path + suffix, 'rb') as f:
+                    encodings[encoding] = f.read()
+
+        return cls(body, stat.st_mtime_ns, stamp, guess_content_type(path), encodings)
+
+class FileCache:
+    """
+    Thread-safe in-memory cache of file contents, checked against the file's (and its siblings') size and mtime on every lookup.
+    """
+    def __init__(self, max_size=max_cached_size):
+        self.max_size = max_size
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size > self.max_size:
+            return None
+
+        stamp = file_stamp(path)
+        entry = self.files.get(path)
+        if entry is not None and entry.stamp == stamp:
+            return entry
+
+        with self.lock:
+            # Another thread may have loaded it while this one waited
+            entry = self.files.get(path)
+            if entry is None or entry.stamp != stamp:
+                entry = CachedFile.load(path, stat, stamp)
+                self.files[path] = entry
+        return entry
+
+    def get_layer(self, path, store):
+        """
+        A layer's current contents from its LayerStore, for layers with saves not yet
+        compacted into the file. The bytes are what compaction will write, so the ETag
+        stays the same once it has.
+        """
+        seq, body = store.render()
+        stamp = ('journal', seq)
+        entry = self.files.get(path)
+        if entry is not None and entry.stamp == stamp:
+            return entry
+
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is None or entry.stamp != stamp:
+                entry = CachedFile(body, store.modified, stamp, 'application/json')
+                self.files[path] = entry
+        return entry
+
+    def preload(self, directory):
+        count = 0
+        if not os.path.isdir(directory):
+            return count
+        for name in sorted(os.listdir(directory)):
+            path = os.path.abspath(os.path.join(directory, name))
+            if os.path.isfile(path) and self.get(path) is not None:
+                count += 1
+        return count
+
+query_prefix = '/query/'
+
+# Recent query responses: (layer, layer version, bbox, filters) -> (body, gzipped body)
+max_cached_queries = 256
+
+class QueryCache:
+    def __init__(self, max_size=max_cached_queries):
+        self.max_size = max_size
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def put(self, key, body):
+        compressed = gzip.compress(body, compresslevel=6, mtime=0) if len(body) > 1024 else None
+        with self.lock:
+            if len(self.results) >= self.max_size:
+                # Drop the oldest entry
+                self.results.pop(next(iter(self.results)))
+            self.results[key] = (body, compressed)
+        return body, compressed
+
+def accepted_encodings(header):
+    # Encodings from an Accept-Encoding header that the client allows (q > 0)
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def parse_range(header, size):
+    """
+    Parse a single byte range header.
+
+    Returns:
+    - (start, end) (tuple): Inclusive byte range, None if the header should be
+      ignored (missing, malformed or several ranges), or False if it can't be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[len('bytes='):].strip().partition('-')
+    try:
+        if start == '':
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length == 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+cache = FileCache()
+layer_stores = LayerStores(os.path.join('backend', 'data'))
+layer_indexes = LayerIndexes(os.path.join('backend', 'data'))
+query_cache = QueryCache()
 
 class CORSRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # For files too big to cache, which SimpleHTTPRequestHandler serves (it knows .gz but not .br)
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, '.br': 'application/x-brotli'}
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'X-Layer-Version')
         super().end_headers()
 
-httpd = HTTPServer(('localhost', 8000), CORSRequestHandler)
-print("Serving on port 8000...")
-httpd.serve_forever()
\ No newline at end of file
+    def do_OPTIONS(self):
+        # CORS preflight
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', self.headers.get('Access-Control-Request-Headers', '*'))
+        self.send_header('Access-Control-Max-Age', '86400')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith(query_prefix):
+            return self.send_query(head=False)
+        if self.path.startswith('/get-layer-data/'):
+            return self.send_layer(head=False)
+        self.send_cached(head=False)
+
+    def do_POST(self):
+        routes = {
+            '/save-layers': self.save_layer,
+            '/patch-layer': self.patch_layer,
+        }
+        route = routes.get(urllib.parse.urlsplit(self.path).path)
+        if route is None:
+            return self.send_error_json(HTTPStatus.NOT_FOUND, f"No route {self.path}", head=False)
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            store = layer_stores.get(request['id'])
+            seq, ops = route(store, request)
+        except ConflictError as e:
+            return self.send_error_json(HTTPStatus.CONFLICT, str(e), head=False)
+        except (KeyError, TypeError, ValueError) as e:
+            return self.send_error_json(HTTPStatus.BAD_REQUEST, f"Error saving file: {e}", head=False)
+
+        body = json.dumps({'message': 'File saved successfully', 'seq': seq, 'ops': ops}).encode()
+        self.send_body(HTTPStatus.OK, body, None, 'application/json', head=False)
+
+    def save_layer(self, store, request):
+        return store.save(request['data'], request.get('base_seq'))
+
+    def patch_layer(self, store, request):
+        ops = request['ops']
+        return store.apply(ops, request.get('base_seq')), len(ops)
+
+    def send_layer(self, head):
+        layer = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path[len('/get-layer-data/'):])
+        if not layer_stores.exists(layer):
+            return self.send_error_json(HTTPStatus.NOT_FOUND, f"Layer {layer} not found", head)
+
+        store = layer_stores.get(layer)
+        with store.lock:
+            body = json.dumps(store.collection, separators=(',', ':')).encode()
+            seq = store.seq
+        compressed = gzip.compress(body, compresslevel=6, mtime=0) if len(body) > 1024 else None
+        self.send_body(HTTPStatus.OK, body, compressed, 'application/json', head, {'X-Layer-Version': str(seq)})
+
+    def do_HEAD(self):
+        if self.path.startswith(query_prefix):
+            return self.send_query(head=True)
+        if self.path.startswith('/get-layer-data/'):
+            return self.send_layer(head=True)
+        self.send_cached(head=True)
+
+    def send_body(self, status, body, compressed, content_type, head, headers=None):
+        use_gzip = compressed is not None and 'gzip' in accepted_encodings(self.headers.get('Accept-Encoding'))
+        if use_gzip:
+            body = compressed
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_error_json(self, status, message, head):
+        body = json.dumps({'message': message}).encode()
+        self.send_body(status, body, None, 'application/json', head)
+
+    def send_query(self, head):
+        url = urllib.parse.urlsplit(self.path)
+        layer = urllib.parse.unquote(url.path[len(query_prefix):])
+        params = urllib.parse.parse_qs(url.query)
+
+        # Index the store's copy while it has saves the file doesn't
+        store = layer_stores.pending(layer) if layer_stores.exists(layer) else None
+        index = layer_indexes.get(layer, store.snapshot() if store else None)
+        if index is None:
+            return self.send_error_json(HTTPStatus.NOT_FOUND, f"Layer {layer} not found", head)
+
+        try:
+            bbox = parse_bbox(params['bbox'][0]) if 'bbox' in params else None
+            filters = params.get('filter', [])
+            key = (layer, index.version, tuple(bbox or ()), tuple(filters))
+            result = query_cache.get(key)
+            if result is None:
+                collection = index.query_collection(bbox, filters)
+                result = query_cache.put(key, json.dumps(collection, separators=(',', ':')).encode())
+        except ValueError as e:
+            return self.send_error_json(HTTPStatus.BAD_REQUEST, str(e), head)
+
+        body, compressed = result
+        self.send_body(HTTPStatus.OK, body, compressed, 'application/json', head)
+
+    def not_modified(self, entry):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or entry.etag in tags or any(tag.startswith(entry.etag[:-1] + '-') for tag in tags)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return entry.mtime // 1_000_000_000 <= since
+        return False
+
+    def pending_layer(self, path):
+        # The LayerStore for a backend/data/<layer>.json path, if it has saves the file doesn't have yet
+        directory, name = os.path.split(path)
+        if directory != os.path.abspath(layer_stores.directory) or not name.endswith('.json'):
+            return None
+        layer = name[:-len('.json')]
+        return layer_stores.pending(layer) if layer_stores.exists(layer) else None
+
+    def send_cached(self, head):
+        path = self.translate_path(self.path)
+        store = self.pending_layer(path)
+        if store is not None:
+            entry = cache.get_layer(path, store)
+        else:
+            entry = cache.get(path) if os.path.isfile(path) else None
+        if entry is None:
+            # Directories, missing files and very large files
+            return super().do_GET() if not head else super().do_HEAD()
+
+        if self.not_modified(entry):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', entry.etag)
+            self.send_header('Last-Modified', entry.last_modified)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        body = entry.body
+        status = HTTPStatus.OK
+        encoding = None
+        content_range = None
+
+        byte_range = None
+        if_range = self.headers.get('If-Range')
+        if if_range is None or if_range in (entry.etag, entry.last_modified):
+            byte_range = parse_range(self.headers.get('Range'), len(body))
+
+        if byte_range is False:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{len(body)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if byte_range:
+            # Ranges are always served from the uncompressed file
+            start, end = byte_range
+            body = body[start:end + 1]
+            status = HTTPStatus.PARTIAL_CONTENT
+            content_range = f'bytes {start}-{end}/{entry.size}'
+        else:
+            accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+            for name in ('br', 'gzip'):
+                if name in entry.encodings and name in accepted:
+                    encoding = name
+                    body = entry.encodings[name]
+                    break
+
+        self.send_response(status)
+        self.send_header('Content-Type', entry.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', entry.last_modified)
+        # Each representation gets its own ETag so caches don't mix them up
+        self.send_header('ETag', entry.etag if encoding is None else entry.etag[:-1] + f'-{encoding}"')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+        if not head:
+            self.wfile.write(body)
+
+def run(port=8000):
+    for directory in preload_dirs:
+        count = cache.preload(directory)
+        print(f"Cached {count} files from {directory}")
+    print(f"Indexed layers: {', '.join(layer_indexes.load_all())}")
+
+    # Stop the same way on kill as on Ctrl+C, so journaled edits get compacted
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    httpd = ThreadingHTTPServer(('localhost', port), CORSRequestHandler)
+    print(f"Serving on port {port}...")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        # Bring the layer files up to date with any journaled edits
+        layer_stores.compact_all()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
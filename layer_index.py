@@ -0,0 +1,321 @@
+import bisect
+import json
+import os
+import threading
+import numpy as np
+
+'''
+Spatial and attribute indexes over the GeoJSON layers in backend/data, so the map
+apps can ask for just the features they need instead of fetching whole layers.
+
+Each layer gets an R-tree over its feature bounding boxes, bulk-loaded with
+Sort-Tile-Recursive packing, plus per-attribute indexes: a hash index for equality
+filters and a sorted index for range filters. Indexes for indexed_fields are built
+up front; any other property is indexed the first time it's filtered on.
+
+Query syntax (as used by cors_server.py's /query/<layer> route):
+    bbox=min_lon,min_lat,max_lon,max_lat       features whose bounding box intersects
+    filter=General Health=E,G                   property is one of the values
+    filter=DBH (inches)>=12                     also !=, <, <=, >, >=
+Several filters are combined with AND.
+'''
+
+# Properties indexed as soon as a layer is loaded (tree inventory fields from process_table_data)
+indexed_fields = ['General Health', 'Botanical Name', 'Common Name', 'Tree ID']
+
+# Children per R-tree node
+node_capacity = 16
+
+# Longest operators first, so '>=' isn't read as '>'
+filter_operators = ['!=', '>=', '<=', '=', '>', '<']
+
+def _positions(geometry):
+    coordinates = geometry['coordinates']
+    depth = {'Point': 0, 'MultiPoint': 1, 'LineString': 1, 'MultiLineString': 2, 'Polygon': 2, 'MultiPolygon': 3}[geometry['type']]
+    if depth == 0:
+        return [coordinates]
+    for _ in range(depth - 1):
+        coordinates = [position for part in coordinates for position in part]
+    return coordinates
+
+def feature_bbox(feature):
+    # [min_lon, min_lat, max_lon, max_lat], or None for features without coordinates
+    geometry = feature.get('geometry')
+    if not geometry:
+        return None
+    if geometry['type'] == 'GeometryCollection':
+        boxes = [feature_bbox({'geometry': part}) for part in geometry['geometries']]
+        boxes = [box for box in boxes if box]
+        if not boxes:
+            return None
+        return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+    positions = _positions(geometry)
+    if not positions:
+        return None
+    xs = [position[0] for position in positions]
+    ys = [position[1] for position in positions]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+def _str_order(boxes, capacity):
+    # Sort-Tile-Recursive: slice by x center, then sort each slice by y center
+    n = len(boxes)
+    leaves = -(-n // capacity)
+    slices = int(np.ceil(np.sqrt(leaves)))
+    slice_size = slices * capacity
+
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    by_x = np.argsort(centers[:, 0], kind='stable')
+    order = []
+    for start in range(0, n, slice_size):
+        chunk = by_x[start:start + slice_size]
+        order.append(chunk[np.argsort(centers[chunk, 1], kind='stable')])
+    return np.concatenate(order) if order else by_x
+
+class RTree:
+    """
+    Static R-tree over bounding boxes, packed with Sort-Tile-Recursive.
+
+    Every level is stored as arrays, bottom up: the boxes of its nodes and, for each
+    node, the range of its children in the level below. Each level is STR-sorted
+    before being grouped into the level above, so queries test a node's children
+    with one vectorized comparison.
+    """
+    def __init__(self, boxes, capacity=node_capacity):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.size = len(boxes)
+
+        # Level 0 holds the items themselves, in STR order
+        self.items = _str_order(boxes, capacity) if self.size else np.arange(0)
+        level = boxes[self.items]
+        self.level_boxes = [level]
+        self.level_ranges = [None]
+
+        while len(level) > 1:
+            starts = np.arange(0, len(level), capacity)
+            ends = np.minimum(starts + capacity, len(level))
+            parents = np.column_stack([
+                np.minimum.reduceat(level[:, 0], starts),
+                np.minimum.reduceat(level[:, 1], starts),
+                np.maximum.reduceat(level[:, 2], starts),
+                np.maximum.reduceat(level[:, 3], starts),
+            ])
+            ranges = np.column_stack([starts, ends])
+
+            # Pack the parents the same way, keeping each one's child range with it
+            order = _str_order(parents, capacity)
+            level = parents[order]
+            self.level_boxes.append(level)
+            self.level_ranges.append(ranges[order])
+
+    def query(self, bbox):
+        """
+        Indices of the boxes that intersect bbox (min_x, min_y, max_x, max_y), in no particular order.
+        """
+        if self.size == 0:
+            return np.arange(0)
+        x0, y0, x1, y1 = bbox
+
+        top = len(self.level_boxes) - 1
+        candidates = np.arange(len(self.level_boxes[top]))
+        for depth in range(top, -1, -1):
+            b = self.level_boxes[depth][candidates]
+            candidates = candidates[(b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)]
+            if depth == 0 or len(candidates) == 0:
+                break
+            ranges = self.level_ranges[depth][candidates]
+            candidates = np.concatenate([np.arange(start, end) for start, end in ranges])
+
+        # Empty if the search stopped above the leaves
+        return self.items[candidates] if depth == 0 else np.arange(0)
+
+class AttributeIndex:
+    """
+    Equality (hash) and range (sorted) index over one property of a layer.
+    """
+    def __init__(self, features, field):
+        self.field = field
+        self.values = {}
+        sortable = []
+        for i, feature in enumerate(features):
+            value = (feature.get('properties') or {}).get(field)
+            if value is None:
+                continue
+            self.values.setdefault(value, []).append(i)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                sortable.append((value, i))
+        sortable.sort()
+        self.sorted_values = [value for value, i in sortable]
+        self.sorted_ids = [i for value, i in sortable]
+        self.numeric = bool(sortable) and len(sortable) == sum(len(ids) for ids in self.values.values())
+
+    def _coerce(self, text):
+        # Query values arrive as strings; compare numerically for numeric fields
+        if self.numeric:
+            try:
+                return float(text)
+            except ValueError:
+                return text
+        return text
+
+    def equal(self, texts):
+        ids = set()
+        for text in texts:
+            value = self._coerce(text)
+            ids.update(self.values.get(value, []))
+        return ids
+
+    def compare(self, operator, text):
+        value = self._coerce(text)
+        if operator == '=':
+            return self.equal(text.split(','))
+        if operator == '!=':
+            excluded = self.equal(text.split(','))
+            return {i for ids in self.values.values() for i in ids} - excluded
+        if not self.numeric:
+            raise ValueError(f"Field {self.field} isn't numeric, so {operator} isn't supported (supported: =, !=)")
+
+        if operator == '>':
+            start, end = bisect.bisect_right(self.sorted_values, value), len(self.sorted_values)
+        elif operator == '>=':
+            start, end = bisect.bisect_left(self.sorted_values, value), len(self.sorted_values)
+        elif operator == '<':
+            start, end = 0, bisect.bisect_left(self.sorted_values, value)
+        else:
+            start, end = 0, bisect.bisect_right(self.sorted_values, value)
+        return set(self.sorted_ids[start:end])
+
+def parse_filter(text):
+    """
+    Split a filter such as 'General Health=E,G' or 'DBH (inches)>=12' into (field, operator, value).
+    """
+    # The first operator in the string ends the field name
+    positions = [(text.find(operator), -len(operator), operator) for operator in filter_operators if operator in text]
+    if not positions:
+        raise ValueError(f"Filter {text} has no operator (supported: {filter_operators})")
+    index, _, operator = min(positions)
+    field = text[:index].strip()
+    value = text[index + len(operator):].strip()
+    if not field:
+        raise ValueError(f"Filter {text} has no field name")
+    return field, operator, value
+
+def parse_bbox(text):
+    try:
+        bbox = [float(value) for value in text.split(',')]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4:
+        raise ValueError(f"Bounding box {text} must be min_lon,min_lat,max_lon,max_lat")
+    return bbox
+
+class LayerIndex:
+    """
+    A GeoJSON layer with its R-tree and attribute indexes.
+
+    Usage:
+        trees = LayerIndex('backend/data/trees.json')
+        trees.query(bbox=[-71.58, 43.19, -71.57, 43.195], filters=['General Health=E'])
+    """
+    def __init__(self, path, fields=indexed_fields, data=None, version=None):
+        # data, if given, is indexed instead of the file (e.g. a layer with journaled saves);
+        # version identifies the contents, for caching query results
+        self.path = path
+        self.version = version
+        if data is None:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        self.data = data
+        self.features = self.data['features']
+
+        boxes = [feature_bbox(feature) for feature in self.features]
+        self.located = np.array([i for i, box in enumerate(boxes) if box is not None], dtype=int)
+        self.rtree = RTree([box for box in boxes if box is not None])
+
+        self.attributes = {}
+        for field in fields:
+            if any(field in (feature.get('properties') or {}) for feature in self.features):
+                self.attributes[field] = AttributeIndex(self.features, field)
+
+    def attribute(self, field):
+        if field not in self.attributes:
+            self.attributes[field] = AttributeIndex(self.features, field)
+        return self.attributes[field]
+
+    def query_ids(self, bbox=None, filters=()):
+        ids = None
+        if bbox is not None:
+            ids = set(self.located[self.rtree.query(bbox)].tolist())
+        for text in filters:
+            field, operator, value = parse_filter(text)
+            matches = self.attribute(field).compare(operator, value)
+            ids = matches if ids is None else ids & matches
+        if ids is None:
+            return list(range(len(self.features)))
+        return sorted(ids)
+
+    def query(self, bbox=None, filters=()):
+        """
+        Features matching a bounding box and every filter, in layer order.
+        """
+        return [self.features[i] for i in self.query_ids(bbox, filters)]
+
+    def query_collection(self, bbox=None, filters=()):
+        return {**self.data, 'features': self.query(bbox, filters)}
+
+class LayerIndexes:
+    """
+    LayerIndex for every layer in a directory, rebuilt when a layer file changes.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.layers = {}
+        self.lock = threading.Lock()
+
+    def path(self, layer):
+        # Layer ids are file names without .json, and can't leave the directory
+        if not layer or os.path.basename(layer) != layer or layer.startswith('.'):
+            return None
+        path = os.path.join(self.directory, layer + '.json')
+        return path if os.path.isfile(path) else None
+
+    def get(self, layer, snapshot=None):
+        """
+        Index for a layer, or None if there's no such layer.
+
+        Args:
+        - layer (str): Layer id (file name without .json).
+        - snapshot (tuple): (seq, collection) to index instead of the file, for layers
+          with saved edits the file doesn't have yet (see LayerStore.snapshot).
+        """
+        path = self.path(layer)
+        if path is None:
+            return None
+        if snapshot is not None:
+            version, data = ('journal', snapshot[0]), snapshot[1]
+        else:
+            version, data = os.stat(path).st_mtime_ns, None
+        entry = self.layers.get(layer)
+        if entry is None or entry[0] != version:
+            with self.lock:
+                entry = self.layers.get(layer)
+                if entry is None or entry[0] != version:
+                    entry = (version, LayerIndex(path, data=data, version=version))
+                    self.layers[layer] = entry
+        return entry[1]
+
+    def load_all(self):
+        names = sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for name in names:
+            self.get(name)
+        return names
+
+if __name__ == "__main__":
+    import time
+    start = time.time()
+    indexes = LayerIndexes(os.path.join('backend', 'data'))
+    names = indexes.load_all()
+    print(f"Indexed {len(names)} layers in {time.time() - start:.2f}s")
+
+    trees = indexes.get('trees')
+    healthy = trees.query(filters=['General Health=E'])
+    print(f"{len(healthy)} of {len(trees.features)} trees are in excellent health")
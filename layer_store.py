@@ -0,0 +1,372 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+'''
+Journaled storage for the editable layers in backend/data.
+
+Saving a layer used to rewrite the whole file (flowerBeds.json is over 2 MB) on every
+edit, with nothing stopping two saves from interleaving. Here each layer is a base
+file plus an append-only journal next to it (flowerBeds.json + flowerBeds.journal):
+
+- A save is diffed against the current features and only the changed runs of features
+  are appended to the journal as splice operations, so it costs time proportional to
+  the edit, not the layer.
+- Every change to a layer happens under that layer's lock, and journal entries are
+  flushed to disk before the save returns.
+- Once the journal grows past a fraction of the base file it's compacted: the current
+  layer is written to a temporary file and renamed over the base, so readers only ever
+  see a complete file. The journal's header records a hash of the base it applies to,
+  so a crash part way through compaction can't replay edits twice.
+- Until then the base file is behind, so anything serving the layer should use
+  render() or snapshot() while pending is non-zero.
+- If the base file is rewritten by something else, the store reloads it on the next
+  refresh() (LayerStores.get does this) and journaled edits not yet in it are dropped,
+  rather than compaction overwriting the outside change.
+
+Journal lines are JSON: a header {"layer": ..., "base": <sha1 of the base file>, "seq": n}, then
+one {"seq": n, "time": t, "ops": [...]} per save. Operations:
+    {"op": "splice", "start": i, "delete": k, "insert": [features]}
+    {"op": "members", "members": {...}}     top-level members other than "features"
+'''
+
+# Compact once the journal is this large relative to the base file (and at least compact_min_bytes)
+compact_ratio = 0.5
+compact_min_bytes = 64 * 1024
+
+layer_name_pattern = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+def feature_key(feature):
+    # Content hash used to tell which features a save actually changed
+    text = json.dumps(feature, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def _write_atomic(path, data):
+    # Write to a temporary file, flush it to disk, then rename it over path
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def diff_features(old_keys, new_features, new_keys=None):
+    """
+    Splice operations that turn a feature list with old_keys into new_features.
+
+    Operations are ordered from the end of the list backwards, so each one's start
+    index is still valid when it's applied.
+    """
+    if new_keys is None:
+        new_keys = [feature_key(feature) for feature in new_features]
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag != 'equal':
+            ops.append({'op': 'splice', 'start': i1, 'delete': i2 - i1, 'insert': new_features[j1:j2]})
+    return ops
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def validate_ops(ops):
+    """
+    Check journal operations are well formed before any of them is applied or written,
+    raising ValueError for the first one that isn't.
+    """
+    if not isinstance(ops, list):
+        raise ValueError("Operations must be a list")
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind == 'splice':
+            if not _is_count(op.get('start')) or not _is_count(op.get('delete')):
+                raise ValueError(f"Splice start and delete must be non-negative integers, not {op.get('start')!r} and {op.get('delete')!r}")
+            insert = op.get('insert')
+            if not isinstance(insert, list) or not all(isinstance(feature, dict) and feature.get('type') == 'Feature' for feature in insert):
+                raise ValueError("Splice insert must be a list of GeoJSON features")
+        elif kind == 'members':
+            if not isinstance(op.get('members'), dict):
+                raise ValueError("Members operation needs a members object")
+        else:
+            raise ValueError(f"Operation {kind} not supported (supported: ['splice', 'members'])")
+
+class ConflictError(Exception):
+    pass
+
+class LayerStore:
+    """
+    One layer's base file and journal, with the current layer held in memory.
+
+    Usage:
+        store = LayerStore('backend/data', 'flowerBeds')
+        store.save(edited_collection)
+        store.collection     # current layer, journal applied
+    """
+    def __init__(self, directory, name):
+        if not layer_name_pattern.match(name):
+            raise ValueError(f"Layer name {name} not supported (letters, digits, _ and - only)")
+        self.name = name
+        self.base_path = os.path.join(directory, name + '.json')
+        self.journal_path = os.path.join(directory, name + '.journal')
+        self.lock = threading.RLock()
+        self._load()
+
+    def _base_stamp(self):
+        try:
+            stat = os.stat(self.base_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self):
+        self.base_stamp = self._base_stamp()
+        if os.path.exists(self.base_path):
+            with open(self.base_path, 'rb') as f:
+                data = f.read()
+            self.collection = json.loads(data)
+        else:
+            data = b''
+            self.collection = {'type': 'FeatureCollection', 'features': []}
+        self.base_hash = hashlib.sha1(data).hexdigest()
+        self.base_bytes = len(data)
+        self.modified = self.base_stamp[1] if self.base_stamp else time.time_ns()
+        self._rendered = None
+        self.keys = [feature_key(feature) for feature in self.collection['features']]
+        self.seq = 0
+        self.journal_bytes = 0
+        self.journal_valid = False
+        self.pending = 0 # journal entries not yet compacted into the base file
+
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'rb') as f:
+            lines = f.read().split(b'\n')
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return
+        self.seq = header.get('seq', 0)
+        if header.get('base') != self.base_hash:
+            # Written against an older base that has since been compacted (the base
+            # already has these edits), so only keep counting versions from it
+            for line in lines[1:]:
+                try:
+                    self.seq = json.loads(line)['seq']
+                except ValueError:
+                    break
+            return
+
+        good_bytes = len(lines[0]) + 1
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                self._apply_ops(entry['ops'])
+                seq = entry['seq']
+            except (KeyError, TypeError, ValueError) as e:
+                # A torn last line from a crash mid-append, or an entry this store can't apply.
+                # Either way nothing after it can be replayed, so the journal is cut here.
+                print(f"WARNING: {self.journal_path} stops replaying at an unreadable entry ({e})")
+                break
+            self.seq = seq
+            self.pending += 1
+            good_bytes += len(line) + 1
+
+        self.journal_valid = True
+        self.journal_bytes = good_bytes
+        if self.pending:
+            self.modified = os.stat(self.journal_path).st_mtime_ns
+        if good_bytes < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_bytes)
+
+    def _apply_ops(self, ops):
+        # All or nothing: if any op fails, the layer is left as it was and the error raised
+        validate_ops(ops)
+        collection, features, keys = self.collection, list(self.collection['features']), list(self.keys)
+        try:
+            self._apply_each(ops)
+        except (KeyError, TypeError, ValueError):
+            collection['features'] = features
+            self.collection, self.keys = collection, keys
+            raise
+
+    def _apply_each(self, ops):
+        features = self.collection['features']
+        for op in ops:
+            if op['op'] == 'splice':
+                start, end = op['start'], op['start'] + op['delete']
+                if end > len(features):
+                    raise ValueError(f"Splice {start}:{end} is outside layer {self.name} ({len(features)} features)")
+                features[start:end] = op['insert']
+                self.keys[start:end] = [feature_key(feature) for feature in op['insert']]
+            elif op['op'] == 'members':
+                self.collection = {**op['members'], 'features': features}
+            else:
+                raise ValueError(f"Operation {op['op']} not supported (supported: ['splice', 'members'])")
+
+    def _start_journal(self):
+        # seq carries the layer's version number across compactions
+        header = json.dumps({'layer': self.name, 'base': self.base_hash, 'seq': self.seq}) + '\n'
+        _write_atomic(self.journal_path, header.encode())
+        self.journal_bytes = len(header)
+        self.journal_valid = True
+
+    def apply(self, ops, base_seq=None):
+        """
+        Apply operations and append them to the journal.
+
+        Args:
+        - ops (list): Journal operations (see module docstring).
+        - base_seq (int): If given, the sequence number the ops were made against;
+          the save is refused if the layer has changed since.
+
+        Returns:
+        - seq (int): Sequence number of this change (unchanged if there were no ops).
+        """
+        with self.lock:
+            if base_seq is not None and base_seq != self.seq:
+                raise ConflictError(f"Layer {self.name} is at version {self.seq}, not {base_seq}")
+            if not ops:
+                return self.seq
+
+            # Check the ops apply cleanly before anything is written
+            self._apply_ops(ops)
+
+            if not self.journal_valid:
+                self._start_journal()
+            entry = json.dumps({'seq': self.seq + 1, 'time': time.time(), 'ops': ops}, separators=(',', ':')) + '\n'
+            with open(self.journal_path, 'ab') as f:
+                f.write(entry.encode())
+                f.flush()
+                os.fsync(f.fileno())
+            self.seq += 1
+            self.pending += 1
+            self.journal_bytes += len(entry)
+            self.modified = time.time_ns()
+
+            if self.journal_bytes > max(compact_min_bytes, compact_ratio * self.base_bytes):
+                self.compact()
+            return self.seq
+
+    def save(self, collection, base_seq=None):
+        """
+        Save a whole edited FeatureCollection, journaling only what changed.
+        Returns (seq, number of operations).
+        """
+        with self.lock:
+            features = collection.get('features')
+            if not isinstance(features, list):
+                raise ValueError("Layer data must be a FeatureCollection with a features list")
+            ops = diff_features(self.keys, features)
+
+            members = {key: value for key, value in collection.items() if key != 'features'}
+            current = {key: value for key, value in self.collection.items() if key != 'features'}
+            if members != current:
+                ops.append({'op': 'members', 'members': members})
+
+            return self.apply(ops, base_seq), len(ops)
+
+    def refresh(self):
+        """
+        Reload the layer if its base file was changed by something other than this store.
+        Returns True if it was reloaded.
+        """
+        with self.lock:
+            stamp = self._base_stamp()
+            if stamp == self.base_stamp:
+                return False
+            data = b''
+            if stamp is not None:
+                with open(self.base_path, 'rb') as f:
+                    data = f.read()
+            if hashlib.sha1(data).hexdigest() == self.base_hash:
+                # Touched but not changed
+                self.base_stamp = stamp
+                return False
+
+            if self.pending:
+                print(f"WARNING: {self.base_path} changed on disk, dropping {self.pending} journaled saves not yet written to it")
+            seq = self.seq
+            self._load()
+            # The outside change is a new version, so saves made against the old one conflict
+            self.seq = max(self.seq, seq) + 1
+            self.pending = 0
+            self._start_journal()
+            return True
+
+    def render(self):
+        """
+        The current layer as compact() writes it, as (seq, bytes). Cached until the next change.
+        """
+        with self.lock:
+            if self._rendered is None or self._rendered[0] != self.seq:
+                self._rendered = (self.seq, json.dumps(self.collection, indent=2).encode())
+            return self._rendered
+
+    def snapshot(self):
+        """
+        (seq, collection) for the current layer. The features list is copied, so later saves don't change it.
+        """
+        with self.lock:
+            return self.seq, {**self.collection, 'features': list(self.collection['features'])}
+
+    def compact(self):
+        """
+        Write the current layer over the base file and start an empty journal.
+        """
+        with self.lock:
+            if self.refresh():
+                return # the base file was replaced, and now it's what the store holds
+            seq, data = self.render()
+            _write_atomic(self.base_path, data)
+            self.base_stamp = self._base_stamp()
+            self.base_hash = hashlib.sha1(data).hexdigest()
+            self.base_bytes = len(data)
+            self._start_journal()
+            self.pending = 0
+
+class LayerStores:
+    """
+    One LayerStore per layer in a directory, opened on first use.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.stores = {}
+        self.lock = threading.Lock()
+
+    def exists(self, name):
+        if not layer_name_pattern.match(name):
+            return False
+        return name in self.stores or os.path.exists(os.path.join(self.directory, name + '.json'))
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.stores:
+                self.stores[name] = LayerStore(self.directory, name)
+            store = self.stores[name]
+        store.refresh()
+        return store
+
+    def pending(self, name):
+        """
+        The layer's store if it's open and has saves its base file doesn't have yet, else None.
+        """
+        store = self.stores.get(name)
+        if store is None:
+            return None
+        store.refresh()
+        return store if store.pending else None
+
+    def compact_all(self):
+        with self.lock:
+            stores = list(self.stores.values())
+        for store in stores:
+            if store.pending:
+                store.compact()
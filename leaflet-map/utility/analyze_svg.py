@@ -1,5 +1,7 @@
 import xml.etree.ElementTree as ET
 import re
+import sys
+from svg_stream import iter_svg, local_name
 
 def parse_color(color_str):
     if color_str.startswith('rgb'):
@@ -21,6 +23,28 @@ def extract_style_colors(style):
             colors['stroke'] = parse_color(stroke_match.group(1))
     return colors
 
+def add_element(features, elem):
+    tag = local_name(elem.tag)
+    
+    if tag not in features:
+        features[tag] = {'count': 0, 'colors': set()}
+    
+    features[tag]['count'] += 1
+    
+    # Check for fill and stroke attributes
+    fill = elem.get('fill')
+    stroke = elem.get('stroke')
+    
+    if fill:
+        features[tag]['colors'].add(('fill', parse_color(fill)))
+    if stroke:
+        features[tag]['colors'].add(('stroke', parse_color(stroke)))
+    
+    # Check for colors in style attribute
+    style_colors = extract_style_colors(elem.get('style'))
+    for color_type, color in style_colors.items():
+        features[tag]['colors'].add((color_type, color))
+
 def analyze_svg(file_path):
     tree = ET.parse(file_path)
     root = tree.getroot()
@@ -31,26 +55,20 @@ def analyze_svg(file_path):
     features = {}
     
     for elem in root.findall(".//*", ns):
-        tag = elem.tag.split('}')[-1]  # Remove namespace
-        
-        if tag not in features:
-            features[tag] = {'count': 0, 'colors': set()}
-        
-        features[tag]['count'] += 1
-        
-        # Check for fill and stroke attributes
-        fill = elem.get('fill')
-        stroke = elem.get('stroke')
-        
-        if fill:
-            features[tag]['colors'].add(('fill', parse_color(fill)))
-        if stroke:
-            features[tag]['colors'].add(('stroke', parse_color(stroke)))
-        
-        # Check for colors in style attribute
-        style_colors = extract_style_colors(elem.get('style'))
-        for color_type, color in style_colors.items():
-            features[tag]['colors'].add((color_type, color))
+        add_element(features, elem)
+    
+    return features
+
+def analyze_svg_stream(file_path):
+    '''
+    Same tag counts and color sets as analyze_svg, read with iterparse so memory doesn't grow with the file.
+    '''
+    features = {}
+    
+    # Elements are counted at their start tag, in the same order findall visits them (the root isn't counted)
+    for event, elem, depth in iter_svg(file_path):
+        if event == 'start' and depth > 0:
+            add_element(features, elem)
     
     return features
 
@@ -66,6 +84,11 @@ def print_analysis(features):
             print("No color information found for this feature.")
 
 if __name__ == "__main__":
-    svg_file = "planting_beds.svg"  # Replace with your SVG file path
-    features = analyze_svg(svg_file)
+    # Usage: python analyze_svg.py [--stream] [svg_file]
+    args = [arg for arg in sys.argv[1:] if arg != '--stream']
+    svg_file = args[0] if args else "planting_beds.svg"  # Replace with your SVG file path
+    if '--stream' in sys.argv:
+        features = analyze_svg_stream(svg_file)
+    else:
+        features = analyze_svg(svg_file)
     print_analysis(features)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from lxml import etree
+import sys
 
 def is_red_feature(element):
     stroke = element.get('stroke')
@@ -29,5 +30,37 @@ def extract_red_paths(input_svg, output_svg):
     new_tree = etree.ElementTree(new_root)
     new_tree.write(output_svg, pretty_print=True, xml_declaration=True, encoding="utf-8")
 
-# Usage
-extract_red_paths("planting_beds.svg", "red_paths.svg")
\ No newline at end of file
+def extract_red_paths_stream(input_svg, output_svg):
+    '''
+    Streaming version of extract_red_paths. Red paths are written with lxml's incremental
+    writer as they're parsed, and each element is cleared (and its finished siblings
+    deleted) once it has been handled, so memory stays flat however large the SVG is.
+    Returns the number of paths written.
+    '''
+    path_tag = "{http://www.w3.org/2000/svg}path"
+    count = 0
+
+    with etree.xmlfile(output_svg, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element("svg", nsmap={None: "http://www.w3.org/2000/svg"}):
+            xf.write("\n")
+            for event, element in etree.iterparse(input_svg, events=("end",)):
+                if element.tag == path_tag and is_red_feature(element):
+                    element.tail = None
+                    xf.write(element, pretty_print=True)
+                    count += 1
+
+                # Free the element, and the empty siblings before it that the parent still holds
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    return count
+
+if __name__ == "__main__":
+    # Usage: python extract_paths.py [--stream]
+    if '--stream' in sys.argv:
+        count = extract_red_paths_stream("planting_beds.svg", "red_paths.svg")
+        print(f"Wrote {count} red paths to red_paths.svg")
+    else:
+        extract_red_paths("planting_beds.svg", "red_paths.svg")
@@ -1,4 +1,6 @@
 from xml.etree import ElementTree as ET
+import sys
+from svg_stream import iter_svg, svg_start_tag, element_to_string
 
 # Function to find all paths with a specific fill color
 def find_all_paths_with_color(svg_root, color_value):
@@ -24,20 +26,70 @@ def extract_elements_by_attributes(svg_root, color_value):
     
     return new_root
 
-# Load and parse the SVG file
-planting_beds_svg_path = 'mnt/data/planting_beds.svg'  # Replace with your file path
-tree_planting_beds = ET.parse(planting_beds_svg_path)
-root_planting_beds = tree_planting_beds.getroot()
+def filter_svg_stream(input_svg_path, output_svg_path, color_value):
+    """
+    Streaming version of extract_elements_by_attributes: writes the root <svg>, its first
+    <defs>, and every path filled with color_value to output_svg_path as the input is read,
+    so memory stays the same however large the input is.
 
-# Define the red color value to search for
-red_color_value = 'rgb(100%, 0%, 0%)'  # Red color representation
+    The <defs> is written where it appears in the input, which for Cairo exports is before
+    any paths (extract_elements_by_attributes always puts it first).
 
-# Extract paths with red color from planting_beds.svg
-filtered_root_red_paths = extract_elements_by_attributes(root_planting_beds, red_color_value)
+    Returns:
+    - count (int): Number of paths written.
+    """
+    path_tag = '{http://www.w3.org/2000/svg}path'
+    defs_tag = '{http://www.w3.org/2000/svg}defs'
+    count = 0
+    defs_state = None # 'reading' while inside the first top-level <defs>, then 'written'
 
-# Save the filtered SVG containing only red paths
-filtered_red_paths_svg_path = 'mnt/data/filtered_red_paths.svg'  # Replace with your desired file path
-filtered_tree_red_paths = ET.ElementTree(filtered_root_red_paths)
-filtered_tree_red_paths.write(filtered_red_paths_svg_path)
+    with open(output_svg_path, 'w', encoding='utf-8') as out:
+        for event, element, depth in iter_svg(input_svg_path, keep=(defs_tag,)):
+            if event == 'start':
+                if depth == 0:
+                    out.write(svg_start_tag(element))
+                elif depth == 1 and element.tag == defs_tag and defs_state is None:
+                    defs_state = 'reading'
+                continue
 
-print(f"Filtered SVG saved to {filtered_red_paths_svg_path}")
+            if defs_state == 'reading' and depth == 1:
+                out.write(element_to_string(element))
+                # Matching paths inside <defs> go right after it, as they would in the tree version
+                for path in element.iter(path_tag):
+                    if path.attrib.get('fill') == color_value:
+                        out.write(element_to_string(path))
+                        count += 1
+                defs_state = 'written'
+            elif defs_state != 'reading' and element.tag == path_tag and element.attrib.get('fill') == color_value:
+                out.write(element_to_string(element))
+                count += 1
+
+        out.write('</svg>\n')
+
+    return count
+
+if __name__ == "__main__":
+    # Usage: python filter_svg.py [--stream]
+    planting_beds_svg_path = 'mnt/data/planting_beds.svg'  # Replace with your file path
+    filtered_red_paths_svg_path = 'mnt/data/filtered_red_paths.svg'  # Replace with your desired file path
+
+    # Define the red color value to search for
+    red_color_value = 'rgb(100%, 0%, 0%)'  # Red color representation
+
+    if '--stream' in sys.argv:
+        # Filter while reading, without loading the whole SVG
+        count = filter_svg_stream(planting_beds_svg_path, filtered_red_paths_svg_path, red_color_value)
+        print(f"Filtered SVG with {count} red paths saved to {filtered_red_paths_svg_path}")
+    else:
+        # Load and parse the SVG file
+        tree_planting_beds = ET.parse(planting_beds_svg_path)
+        root_planting_beds = tree_planting_beds.getroot()
+
+        # Extract paths with red color from planting_beds.svg
+        filtered_root_red_paths = extract_elements_by_attributes(root_planting_beds, red_color_value)
+
+        # Save the filtered SVG containing only red paths
+        filtered_tree_red_paths = ET.ElementTree(filtered_root_red_paths)
+        filtered_tree_red_paths.write(filtered_red_paths_svg_path)
+
+        print(f"Filtered SVG saved to {filtered_red_paths_svg_path}")
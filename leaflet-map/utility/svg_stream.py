@@ -0,0 +1,68 @@
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+'''
+Streaming reads of large SVGs.
+
+ET.parse keeps every element of a document in memory, and the planting beds SVG exported
+from the 36x48 in sheet is big enough for that to matter. iter_svg reads the file with
+iterparse instead and drops each element once its end tag has been handled, so only the
+elements still open (one per nesting level) are held at any time, whatever the file size.
+'''
+
+svg_namespace = 'http://www.w3.org/2000/svg'
+xlink_namespace = 'http://www.w3.org/1999/xlink'
+
+# Write <path .../> and xlink:href rather than <ns0:path .../> and ns1:href
+ET.register_namespace('', svg_namespace)
+ET.register_namespace('xlink', xlink_namespace)
+
+def local_name(tag):
+    return tag.split('}')[-1]  # Remove namespace
+
+def iter_svg(source, keep=()):
+    """
+    Walk an SVG element by element without building the whole tree.
+
+    Args:
+    - source (str or file): Path to the SVG, or an open file.
+    - keep (tuple): Tags (with namespace) whose whole subtree should still be there at
+      their 'end' event, e.g. a <defs> that is copied to the output. Everything inside
+      them is held until they end.
+
+    Yields:
+    - (event, element, depth): event is 'start' or 'end', depth is 0 for the root.
+      At 'start' the element's tag and attributes are set; by 'end' its text and
+      children are too. After its 'end' event the element is cleared and removed
+      from its parent, so copy anything needed before moving on.
+    """
+    open_elements = []
+    kept = 0 # number of open elements with a tag in keep
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            yield event, elem, len(open_elements)
+            open_elements.append(elem)
+            kept += elem.tag in keep
+        else:
+            open_elements.pop()
+            kept -= elem.tag in keep
+            yield event, elem, len(open_elements)
+            if kept:
+                continue # part of a subtree being kept
+            elem.clear()
+            if open_elements:
+                # Earlier siblings are already gone, so this is the parent's only child
+                open_elements[-1].remove(elem)
+
+def svg_start_tag(root):
+    # Opening <svg> tag for a streamed output file, with the root's own attributes
+    attributes = ''.join(f' {name}={quoteattr(value)}' for name, value in root.attrib.items() if not name.startswith('{'))
+    return f'<svg xmlns="{svg_namespace}" xmlns:xlink="{xlink_namespace}"{attributes}>\n'
+
+def element_to_string(elem):
+    # Each fragment declares its own namespaces, which repeat the root's but keep it valid on its own.
+    # The tail is whatever followed the element in the input, so leave it out.
+    tail, elem.tail = elem.tail, None
+    text = ET.tostring(elem, encoding='unicode')
+    elem.tail = tail
+    return text + '\n'
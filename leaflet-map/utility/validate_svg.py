@@ -1,4 +1,6 @@
 import xml.etree.ElementTree as ET
+import sys
+from svg_stream import iter_svg
 
 def check_svg(file_path):
     try:
@@ -44,13 +46,71 @@ def investigate_svg(file_path):
     except Exception as e:
         print(f"An error occurred: {e}")
 
-# Usage
-investigate_svg('red_paths.svg')
+def check_svg_stream(file_path):
+    '''
+    check_svg without loading the file. The whole file is still read through, so XML
+    errors anywhere in it are caught before the root is reported on.
+    '''
+    try:
+        root_tag = None
+        for event, elem, depth in iter_svg(file_path):
+            if event == 'start' and depth == 0:
+                root_tag = elem.tag
+
+        if root_tag != '{http://www.w3.org/2000/svg}svg':
+            print("Warning: Root element is not <svg> in the SVG namespace")
+        else:
+            print("Basic SVG structure seems okay")
+        return True
+    except ET.ParseError as e:
+        print(f"XML parsing error: {e}")
+        return False
+
+def investigate_svg_stream(file_path):
+    '''
+    Prints the same listing as investigate_svg, one element at a time as the file is read.
+    '''
+    def print_text(element, level):
+        if element.text and element.text.strip():
+            print("  " * level + f"Text content: {element.text.strip()}")
+
+    try:
+        # Elements whose text hasn't been printed yet (None once it has), one per open level.
+        # An element's text is only known once its first child starts or it ends.
+        unprinted = []
+        for event, elem, depth in iter_svg(file_path):
+            if event == 'start':
+                if depth == 0:
+                    print(f"Root element: {elem.tag}")
+                    print("Root attributes:", elem.attrib)
+                if unprinted and unprinted[-1] is not None:
+                    print_text(unprinted[-1], depth - 1)
+                    unprinted[-1] = None
+
+                print("  " * depth + f"Element: {elem.tag}")
+                print("  " * depth + f"Attributes: {elem.attrib}")
+                unprinted.append(elem)
+            else:
+                if unprinted.pop() is not None:
+                    print_text(elem, depth)
+
+    except ET.ParseError as e:
+        print(f"Error parsing SVG: {e}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
+if __name__ == "__main__":
+    # Usage: python validate_svg.py [--stream] [svg_file]
+    args = [arg for arg in sys.argv[1:] if arg != '--stream']
+    file_path = args[0] if args else 'red_paths.svg'
+    if '--stream' in sys.argv:
+        investigate_svg_stream(file_path)
+        parsed = check_svg_stream(file_path)
+    else:
+        investigate_svg(file_path)
+        parsed = check_svg(file_path)
 
-# Usage
-file_path = 'red_paths.svg'
-if check_svg(file_path):
-    print("File parsed successfully, but may still have SVG-specific issues")
-else:
-    print("File could not be parsed as XML")
+    if parsed:
+        print("File parsed successfully, but may still have SVG-specific issues")
+    else:
+        print("File could not be parsed as XML")
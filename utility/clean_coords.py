@@ -1,5 +1,24 @@
 import json
+import heapq
 from math import isclose
+import numpy as np
+
+'''
+Line simplification for GeoJSON layers.
+
+Geometries are simplified per feature on NumPy coordinate arrays, with tolerances in
+meters (coordinates are projected to a local flat approximation around each
+geometry, which is plenty accurate at campus scale). Two modes are supported:
+- 'dp': Douglas-Peucker, drops points closer than the tolerance to the simplified line.
+- 'vw': Visvalingam-Whyatt, drops points whose triangle with their neighbours has an
+  area below tolerance ** 2.
+
+Usage:
+    from clean_coords import simplify_geojson
+    simplified = simplify_geojson(geojson_data, tolerance=0.5, mode='vw')
+'''
+
+EARTH_RADIUS = 6371008.8 # meters
 
 # Function to remove LineString features with less than 3 points
 def filter_short_linestrings(geojson_data):
@@ -28,22 +47,175 @@ def remove_close_coordinates(line_string, threshold):
             cleaned_coords.append(coord)
     return cleaned_coords
 
-# Load the GeoJSON data
-with open('features.geojson', 'r') as f:
-    geojson_data = json.load(f)
+# Project [lon, lat] coordinates to meters on a plane tangent near the coordinates
+def to_meters(coords):
+    lat0 = np.radians(coords[:, 1].mean())
+    scale = np.radians(1) * EARTH_RADIUS
+    return np.column_stack([coords[:, 0] * scale * np.cos(lat0), coords[:, 1] * scale])
+
+# Boolean mask of the points Douglas-Peucker keeps (points in meters)
+def douglas_peucker(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        # Distance from every point in between to the chord segment, in one batch.
+        # Projections are clamped to the segment, so points beyond either end (a line
+        # doubling back) are measured to the nearest endpoint, not the infinite line.
+        a = points[start]
+        chord = points[end] - a
+        offsets = points[start + 1:end] - a
+        length_squared = chord @ chord
+        if length_squared == 0:
+            nearest = np.zeros_like(offsets)
+        else:
+            t = np.clip(offsets @ chord / length_squared, 0, 1)
+            nearest = t[:, None] * chord
+        distances = np.hypot(offsets[:, 0] - nearest[:, 0], offsets[:, 1] - nearest[:, 1])
+
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return keep
+
+# Areas of the triangles formed by each point and its neighbours (points in meters)
+def triangle_areas(prev_points, points, next_points):
+    return np.abs((points[..., 0] - prev_points[..., 0]) * (next_points[..., 1] - prev_points[..., 1]) -
+                  (next_points[..., 0] - prev_points[..., 0]) * (points[..., 1] - prev_points[..., 1])) / 2
+
+# Boolean mask of the points Visvalingam-Whyatt keeps (points in meters)
+def visvalingam_whyatt(points, tolerance):
+    n = len(points)
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+
+    min_area = tolerance ** 2
+    before = list(range(-1, n - 1))
+    after = list(range(1, n + 1))
+
+    areas = np.full(n, np.inf)
+    areas[1:-1] = triangle_areas(points[:-2], points[1:-1], points[2:])
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+
+    while heap:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:
+            continue # removed already, or its area changed since it was pushed
+        if area >= min_area:
+            break
+
+        keep[i] = False
+        p, q = before[i], after[i]
+        after[p] = q
+        before[q] = p
+
+        # Recompute the neighbours' areas; a point never gets easier to remove than the one before it
+        for j in (p, q):
+            if 0 < j < n - 1:
+                new_area = max(triangle_areas(points[before[j]], points[j], points[after[j]]), area)
+                areas[j] = new_area
+                heapq.heappush(heap, (new_area, j))
+
+    return keep
+
+simplifiers = {
+    'dp': douglas_peucker,
+    'vw': visvalingam_whyatt,
+}
+
+def simplify_coords(coords, tolerance, mode='dp', closed=False):
+    """
+    Simplify one line or ring.
+
+    Args:
+    - coords (list): [lon, lat] coordinates.
+    - tolerance (float): Tolerance in meters.
+    - mode (str): 'dp' (Douglas-Peucker) or 'vw' (Visvalingam-Whyatt).
+    - closed (bool): True for polygon rings, which keep at least 4 points.
+
+    Returns:
+    - coords (list): The simplified coordinates.
+    """
+    if mode not in simplifiers:
+        raise ValueError(f"Simplification mode {mode} not supported (supported: {list(simplifiers)})")
+
+    min_points = 4 if closed else 2
+    if len(coords) <= min_points:
+        return coords
+
+    array = np.asarray(coords, dtype=float)
+    keep = simplifiers[mode](to_meters(array[:, :2]), tolerance)
+
+    if keep.sum() < min_points:
+        return coords # too small to simplify without collapsing
+
+    return array[keep].tolist()
+
+def simplify_geometry(geometry, tolerance, mode='dp'):
+    kind = geometry['type']
+    coordinates = geometry['coordinates']
+
+    if kind == 'LineString':
+        coordinates = simplify_coords(coordinates, tolerance, mode)
+    elif kind == 'MultiLineString':
+        coordinates = [simplify_coords(line, tolerance, mode) for line in coordinates]
+    elif kind == 'Polygon':
+        coordinates = [simplify_coords(ring, tolerance, mode, closed=True) for ring in coordinates]
+    elif kind == 'MultiPolygon':
+        coordinates = [[simplify_coords(ring, tolerance, mode, closed=True) for ring in polygon] for polygon in coordinates]
+
+    return {**geometry, 'coordinates': coordinates}
+
+def simplify_features(features, tolerance, mode='dp'):
+    """
+    Yield simplified copies of GeoJSON features (points pass through unchanged).
+    """
+    for feature in features:
+        geometry = feature.get('geometry')
+        if geometry and geometry['type'] not in ('Point', 'MultiPoint', 'GeometryCollection'):
+            feature = {**feature, 'geometry': simplify_geometry(geometry, tolerance, mode)}
+        yield feature
+
+def simplify_geojson(geojson_data, tolerance, mode='dp'):
+    """
+    Simplify every feature in a FeatureCollection.
+
+    Args:
+    - geojson_data (dict): A GeoJSON FeatureCollection (left unchanged).
+    - tolerance (float): Tolerance in meters.
+    - mode (str): 'dp' (Douglas-Peucker) or 'vw' (Visvalingam-Whyatt).
+
+    Returns:
+    - geojson_data (dict): A new FeatureCollection with simplified geometry.
+    """
+    return {
+        **geojson_data,
+        "features": list(simplify_features(geojson_data['features'], tolerance, mode))
+    }
+
+if __name__ == "__main__":
+    # Load the GeoJSON data
+    with open('features.geojson', 'r') as f:
+        geojson_data = json.load(f)
 
-# Set the distance threshold for removing close points
-distance_threshold = 0.000007  # Adjust this value as needed
+    # About the same as the old 0.000007 degree threshold for dropping close points
+    tolerance = 0.5  # meters
 
-# Clean the coordinates in each LineString feature
-for feature in geojson_data['features']:
-    if feature['geometry']['type'] == 'LineString':
-        original_coords = feature['geometry']['coordinates']
-        cleaned_coords = remove_close_coordinates(original_coords, distance_threshold)
-        feature['geometry']['coordinates'] = cleaned_coords
+    cleaned_data = simplify_geojson(geojson_data, tolerance, mode='dp')
 
-# Save the cleaned GeoJSON data to a new file
-with open('cleaned_features.geojson', 'w') as f:
-    json.dump(geojson_data, f, indent=4)
+    # Save the cleaned GeoJSON data to a new file
+    with open('cleaned_features.geojson', 'w') as f:
+        json.dump(cleaned_data, f, indent=4)
 
-print("Cleaned GeoJSON data saved to 'cleaned_features.geojson'")
+    print("Cleaned GeoJSON data saved to 'cleaned_features.geojson'")
@@ -0,0 +1,95 @@
+import math
+
+'''
+Curve handling for PDF drawings.
+
+PyMuPDF gives curves as cubic Bezier 'c' items (start, two control points, end).
+flatten_bezier turns one into line segments, subdividing only where the curve bends
+more than the tolerance, so gentle bed edges get a few points and tight corners more.
+dot_geometry recognizes the small circles drawn as four curves (tree dots and other
+markers) so they can be stored as a center and radius instead.
+'''
+
+# Subdivision depth limit (2 ** 16 segments per curve at most)
+max_depth = 16
+
+def _distance_to_chord(point, start, end):
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return math.hypot(point[0] - start[0], point[1] - start[1])
+    return abs(dx * (point[1] - start[1]) - dy * (point[0] - start[0])) / length
+
+def _split(p0, p1, p2, p3):
+    # de Casteljau split at t = 0.5
+    def mid(a, b):
+        return ((a[0] + b[0]) / 2, (a[1] + b[1]) / 2)
+    p01, p12, p23 = mid(p0, p1), mid(p1, p2), mid(p2, p3)
+    p012, p123 = mid(p01, p12), mid(p12, p23)
+    center = mid(p012, p123)
+    return (p0, p01, p012, center), (center, p123, p23, p3)
+
+def flatten_bezier(p0, p1, p2, p3, tolerance=0.1):
+    """
+    Flatten a cubic Bezier curve into a polyline.
+
+    A piece of the curve is replaced by its chord once both control points are within
+    tolerance of the chord, which bounds the distance between the curve and the polyline.
+
+    Args:
+    - p0, p1, p2, p3 (tuple): Start point, control points and end point.
+    - tolerance (float): Maximum deviation from the curve, in the same units as the points.
+
+    Returns:
+    - points (list): (x, y) points from p0 to p3.
+    """
+    points = [tuple(p0)]
+    stack = [((tuple(p0), tuple(p1), tuple(p2), tuple(p3)), 0)]
+    while stack:
+        curve, depth = stack.pop()
+        start, c1, c2, end = curve
+        flatness = max(_distance_to_chord(c1, start, end), _distance_to_chord(c2, start, end))
+        if flatness <= tolerance or depth >= max_depth:
+            points.append(end)
+        else:
+            left, right = _split(*curve)
+            # Right half goes on the stack first so the left half is emitted first
+            stack.append((right, depth + 1))
+            stack.append((left, depth + 1))
+    return points
+
+def dot_geometry(items, roundness=0.1):
+    """
+    Center and radius of a drawing that is a closed circle made only of curves.
+
+    Args:
+    - items (list): Drawing items.
+    - roundness (float): Allowed relative difference between the radius and the
+      distance from the center to each curve end point.
+
+    Returns:
+    - (center, radius) (tuple), or None if the items aren't a circle.
+    """
+    if len(items) < 2 or any(item[0] != 'c' for item in items):
+        return None
+
+    ends = [item[1] for item in items] + [items[-1][4]]
+    if math.hypot(ends[0][0] - ends[-1][0], ends[0][1] - ends[-1][1]) > 1e-3:
+        return None # not closed
+
+    points = [point for item in items for point in item[1:]]
+    x0 = min(point[0] for point in points)
+    x1 = max(point[0] for point in points)
+    y0 = min(point[1] for point in points)
+    y1 = max(point[1] for point in points)
+    radius = (x1 - x0 + y1 - y0) / 4
+    if radius == 0 or abs((x1 - x0) - (y1 - y0)) > 2 * roundness * radius:
+        return None
+
+    center = ((x0 + x1) / 2, (y0 + y1) / 2)
+    for point in ends:
+        if abs(math.hypot(point[0] - center[0], point[1] - center[1]) - radius) > roundness * radius:
+            return None
+
+    return [center[0], center[1]], radius
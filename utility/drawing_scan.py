@@ -0,0 +1,118 @@
+from collections import Counter
+
+'''
+Single-pass scanning of PDF drawings (page.get_drawings() output).
+
+scan_drawings walks a page's drawings once, building a (type, color) histogram
+and routing each item into every bucket whose predicate it matches, so pulling
+trees, beds and trails off the same sheet only needs one traversal.
+
+Usage:
+    scan = scan_drawings(drawings, {
+        'dots': match(color=RED, types='s', color_of='any'),
+        'beds': match(color=RED, types=('f', 'fs')),
+    })
+    scan['buckets']['dots']  # list of matching drawings
+'''
+
+RED = (1.0, 0.0, 0.0)
+
+'''
+Returns the color that's actually painted for a drawing: the stroke color for
+strokes ('s' and 'fs') and the fill color for fills ('f').
+'''
+def item_color(item):
+    if item['type'] == 'f':
+        color = item.get('fill')
+    else:
+        color = item.get('color')
+    return tuple(color) if color else None
+
+def _colors(item, color_of):
+    if color_of == 'auto':
+        return (item_color(item),)
+
+    stroke = tuple(item['color']) if item.get('color') else None
+    fill = tuple(item['fill']) if item.get('fill') else None
+    if color_of == 'stroke':
+        return (stroke,)
+    elif color_of == 'fill':
+        return (fill,)
+    elif color_of == 'any':
+        return (stroke, fill)
+    raise ValueError(f"color_of {color_of} not supported (supported: auto, stroke, fill, any)")
+
+def _intersects(rect, region):
+    x0, y0, x1, y1 = rect
+    rx0, ry0, rx1, ry1 = region
+    return x0 <= rx1 and x1 >= rx0 and y0 <= ry1 and y1 >= ry0
+
+def match(color=None, types=None, region=None, color_of='auto'):
+    """
+    Build a predicate for scan_drawings.
+
+    Args:
+    - color (tuple): RGB color the drawing must have (exact match, like the old red checks).
+    - types (str or iterable): Allowed drawing types ('s', 'f', 'fs').
+    - region (tuple): (x0, y0, x1, y1) box the drawing's rect must intersect.
+    - color_of (str): Which color to compare: 'auto' (painted color, see item_color),
+      'stroke', 'fill' or 'any' (stroke or fill).
+
+    Returns:
+    - predicate (function): Takes a drawing and returns True if it matches.
+    """
+    if isinstance(types, str):
+        types = (types,)
+    types = set(types) if types else None
+    color = tuple(color) if color else None
+
+    # Fail fast on a bad color_of instead of on the first drawing
+    _colors({'type': 's'}, color_of)
+
+    def predicate(item):
+        if types and item['type'] not in types:
+            return False
+        if color and color not in _colors(item, color_of):
+            return False
+        if region and not _intersects(item['rect'], region):
+            return False
+        return True
+
+    return predicate
+
+def scan_drawings(drawings, buckets=None, scan=None):
+    """
+    Make one pass over a page's drawings.
+
+    Args:
+    - drawings (list): Output of get_drawings().
+    - buckets (dict): Bucket name -> predicate (see match). A drawing goes into every bucket it matches.
+    - scan (dict): Previous scan result to add to (e.g. when scanning several pages).
+
+    Returns:
+    - scan (dict):
+        'histogram': Counter of (type, color) for every drawing.
+        'examples': First drawing seen for each (type, color).
+        'buckets': Bucket name -> list of matching drawings.
+    """
+    buckets = buckets or {}
+    if scan is None:
+        scan = {'histogram': Counter(), 'examples': {}, 'buckets': {}}
+    for name in buckets:
+        scan['buckets'].setdefault(name, [])
+
+    histogram = scan['histogram']
+    examples = scan['examples']
+    routes = [(predicate, scan['buckets'][name]) for name, predicate in buckets.items()]
+
+    for item in drawings:
+        key = (item['type'], item_color(item))
+        if key not in histogram:
+            examples[key] = item
+        histogram[key] += 1
+
+        for predicate, bucket in routes:
+            if predicate(item):
+                bucket.append(item)
+
+    return scan
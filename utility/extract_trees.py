@@ -5,14 +5,23 @@ import json
 import geojson
 from matplotlib.transforms import Bbox
 import os
-from scipy.spatial import distance
+import sys
+from scipy.spatial import cKDTree
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 import pandas as pd
 import re
 import glob
-from pdf_overlay import create_zone_overlay
-from pdf_utils import pdf_to_geo_old
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from pdf_overlay import create_proof_pdf, create_zone_overlay
+from pdf_utils import pdf_to_geo_old_array
+from geojson_writer import FeatureCollectionWriter
+from precompress import precompress
+from page_cache import get_drawings, get_text_dict, get_page, get_pages_text, file_hash, EXTRACTOR_VERSION
+from drawing_scan import RED, match, scan_drawings
 
 # Supported zones and page numbers in tree inventory pdf
 zones = {
@@ -63,7 +72,7 @@ inventory_path = "tree_inventory.pdf"
 
 import geojson
 
-def create_geojson_feature(lat, lon, text_label, properties):
+def create_geojson_feature(lat, lon, text_label, properties, precision=6):
     """
     Create a GeoJSON feature.
 
@@ -72,17 +81,55 @@ def create_geojson_feature(lat, lon, text_label, properties):
     - lon (float): Longitude coordinate.
     - text_label (str): Text label for the feature.
     - properties (dict): Additional properties for the feature.
+    - precision (int): Decimal places kept in the coordinates (6 is about 10 cm).
 
     Returns:
     - geojson.Feature: A GeoJSON feature.
     """
     feature = geojson.Feature(
-        geometry=geojson.Point((lon, lat)),
+        geometry=geojson.Point((lon, lat), precision=precision),
         properties={"id": text_label, **properties}
     )
     return feature
 
-def save_geojson(assignments, bounds, table_data, output_file_path, zone_e=False):
+def join_table_data(assignments, table_data):
+    """
+    Join assignments to table rows on Numerical ID using a hash index built once.
+
+    Args:
+    - assignments (list): List of assignments with PDF coordinates and labels.
+    - table_data (list or DataFrame): Table rows from process_table_data.
+
+    Returns:
+    - (matches, orphan_rows, orphan_assignments) (tuple):
+        matches: list of (assignment, table row) pairs, in assignment order.
+        orphan_rows: table rows with no assigned dot.
+        orphan_assignments: assignments (dots) with no table row.
+    """
+    if isinstance(table_data, pd.DataFrame):
+        table_data = table_data.to_dict('records')
+    
+    # First row wins if an ID is repeated, like the old linear search
+    index = {}
+    for row in table_data:
+        index.setdefault(row['Numerical ID'], row)
+    
+    matches = []
+    orphan_assignments = []
+    matched_ids = set()
+    for assignment in assignments:
+        row = index.get(assignment['n'])
+        if row is None:
+            orphan_assignments.append(assignment)
+        else:
+            matches.append((assignment, row))
+            matched_ids.add(assignment['n'])
+    
+    orphan_rows = [row for row in table_data if row['Numerical ID'] not in matched_ids]
+    
+    return matches, orphan_rows, orphan_assignments
+
+def save_geojson(assignments, bounds, table_data, output_file_path, zone_e=False, precision=6, compress=True):
     """
     Save assignments and table data as GeoJSON features to a file.
 
@@ -91,24 +138,37 @@ def save_geojson(assignments, bounds, table_data, output_file_path, zone_e=False
     - bounds (dict): Dictionary containing the bounds information.
     - table_data (list): List of dictionaries containing table data.
     - output_file_path (str): Path to the output GeoJSON file.
+    - precision (int): Decimal places kept in the coordinates.
+    - compress (bool): Also write .gz/.br copies for the server (see precompress).
+
+    Returns:
+    - (orphan_rows, orphan_assignments) (tuple): Table rows without a dot and dots without a table row.
     """
+    matches, orphan_rows, orphan_assignments = join_table_data(assignments, table_data)
+    
+    if orphan_rows:
+        print(f"WARNING: {len(orphan_rows)} table rows have no dot: {[row['Tree ID'] for row in orphan_rows]}")
+    if orphan_assignments:
+        print(f"WARNING: {len(orphan_assignments)} dots have no table row: {[assignment['n'] for assignment in orphan_assignments]}")
+    
+    # Assignment coords are stored as (y, x); convert them all in one batch
+    pdf_coords = [(assignment['coords'][1], assignment['coords'][0]) for assignment, row in matches]
+    geo_coords = pdf_to_geo_old_array(bounds, pdf_coords, zone_e)
+    
     features = []
-    for assignment in assignments:
-        pdf_y, pdf_x = assignment['coords']
-        lat, lon = pdf_to_geo_old(bounds, pdf_x, pdf_y, zone_e)
-        numerical_id = assignment['n']
-        
-        # Find the corresponding table data entry
-        table_entry = next((item for item in table_data if item['Numerical ID'] == numerical_id), None)
-        
-        if table_entry:
-            feature = create_geojson_feature(lat, lon, numerical_id, table_entry)
-            features.append(feature)
+    for (assignment, table_entry), (lon, lat) in zip(matches, geo_coords):
+        feature = create_geojson_feature(float(lat), float(lon), assignment['n'], table_entry, precision)
+        features.append(feature)
     
     feature_collection = geojson.FeatureCollection(features)
     
     with open(output_file_path, 'w') as f:
         geojson.dump(feature_collection, f)
+    
+    if compress:
+        precompress(output_file_path)
+    
+    return orphan_rows, orphan_assignments
 
 def calculate_center(rect):
     x0, y0, x1, y1 = rect
@@ -117,20 +177,9 @@ def calculate_center(rect):
     return center_x, center_y
 
 def extract_dots(graphics, letter, debug=False):
-    dot_coords = []
-
-    # Define the red color in RGB
-    red_color = (1.0, 0.0, 0.0)
-    
-    for item in graphics:
-        # Get the stroke and fill colors
-        stroke_color = item.get("color")
-        fill_color = item.get("fill")
-        red = (stroke_color and tuple(stroke_color) == red_color) or (fill_color and tuple(fill_color) == red_color)
-        op = item["type"]
-        if red and op == 's': # get all red stroke features (dots)
-            center = calculate_center(item["rect"])
-            dot_coords.append(center)
+    # Red strokes (by stroke or fill color) are the tree dots
+    scan = scan_drawings(graphics, {'dots': match(color=RED, types='s', color_of='any')})
+    dot_coords = [calculate_center(item["rect"]) for item in scan['buckets']['dots']]
     
     # switch x and y remember
     min_x = min(dot_coords, key=lambda coord: coord[1])[1]
@@ -210,36 +259,130 @@ def inspect_assignments(labels, numbers):
             print(f"Label {n}: coords ({label['coords'][0]:.1f}, {label['coords'][1]:.1f}) \t dot ({label['dot_coords'][0]:.1f}, {label['dot_coords'][1]:.1f}) \t (dist {label['distance']:.1f})")
 
 
-def generate_assignments(labels, dots, debug=False):
+def generate_optimal_assignments(labels, dots, debug=False, max_distance=100, k=5):
+    """
+    Pair labels with dots so the total label-to-dot distance is as small as possible.
+
+    Only each label's k nearest dots within max_distance are candidates. Labels that
+    share candidate dots are grouped into connected components, and each component is
+    solved in one shot with linear_sum_assignment, so no dot is claimed twice.
+
+    Args:
+    - labels (dict): Labels from extract_labels (updated in place).
+    - dots (list): Dot coordinates from extract_dots.
+    - debug (bool): Print unmatched labels and dots.
+    - max_distance (float): Labels further than this from every dot stay unmatched.
+    - k (int): Number of nearest dots considered per label.
+
+    Returns:
+    - unmatched (list): Label numbers that could not be paired with a dot.
+    """
     if debug:
-        print('--- generate_assignments debug ---')
+        print('--- generate_optimal_assignments debug ---')
         print(f'Labels: {len(labels.keys())}\t Dots: {len(dots)}\n')
         
-    dots_selected = []
-    selections = {}
+    numbers = list(labels.keys())
+    if not numbers or not dots:
+        return numbers
+    
+    # Candidate pairs: each label's k nearest dots inside the distance cutoff
+    tree = cKDTree(np.asarray(dots, dtype=float))
+    label_coords = np.asarray([labels[n]['coords'] for n in numbers], dtype=float)
+    distances, indices = tree.query(label_coords, k=min(k, len(dots)), distance_upper_bound=max_distance)
+    distances = distances.reshape(len(numbers), -1)
+    indices = indices.reshape(len(numbers), -1)
+    
+    found = np.isfinite(distances)
+    rows = np.repeat(np.arange(len(numbers)), distances.shape[1])[found.ravel()]
+    cols = indices[found]
+    costs = distances[found]
+    
+    # Split the label/dot graph into independent components so each cost matrix stays small
+    graph = coo_matrix((np.ones(len(rows)), (rows, len(numbers) + cols)), shape=(len(numbers) + len(dots),) * 2)
+    _, component = connected_components(graph, directed=False)
+    
+    # Anything outside a label's candidate list costs more than every real pairing
+    # (kept float, or an int max_distance would truncate every distance in the cost matrix)
+    no_pair = float(max_distance) * (len(numbers) + 1)
+    matched = set()
+    for c in np.unique(component[rows]):
+        in_component = component[rows] == c
+        r, r_index = np.unique(rows[in_component], return_inverse=True)
+        d, d_index = np.unique(cols[in_component], return_inverse=True)
+        
+        cost = np.full((len(r), len(d)), no_pair, dtype=float)
+        cost[r_index, d_index] = costs[in_component]
+        
+        for i, j in zip(*linear_sum_assignment(cost)):
+            if cost[i, j] >= no_pair:
+                continue
+            label = labels[numbers[r[i]]]
+            label['dot_coords'] = dots[d[j]]
+            label['distance'] = float(cost[i, j])
+            matched.add(int(d[j]))
+    
+    unmatched = [n for n in numbers if labels[n]['dot_coords'] is None]
+    for n in unmatched:
+        labels[n]['verify'] = True
+    
+    # Tell apart labels with no dot in range from labels whose dots went to other labels
+    has_candidate = found.any(axis=1)
+    out_of_range = [n for i, n in enumerate(numbers) if labels[n]['dot_coords'] is None and not has_candidate[i]]
+    contested = [n for i, n in enumerate(numbers) if labels[n]['dot_coords'] is None and has_candidate[i]]
+    if out_of_range:
+        print(f"WARNING: {len(out_of_range)} labels have no dot within {max_distance}: {out_of_range}")
+    if contested:
+        print(f"WARNING: {len(contested)} labels lost every dot in range to other labels: {contested}")
+        
+    if debug:
+        print("\nUnpaired dots")
+        for i, dot in enumerate(dots):
+            if i not in matched:
+                print(dot)
+            
+    return unmatched
+
+def generate_assignments(labels, dots, debug=False, max_distance=100, mode='greedy', k=5):
+    if mode == 'optimal':
+        generate_optimal_assignments(labels, dots, debug, max_distance, k)
+        return [{'n': n, 'coords': label['dot_coords']} for n, label in labels.items() if label['dot_coords'] is not None]
+    elif mode != 'greedy':
+        raise ValueError(f"Assignment mode {mode} not supported (supported: greedy, optimal)")
+    
+    if debug:
+        print('--- generate_assignments debug ---')
+        print(f'Labels: {len(labels.keys())}\t Dots: {len(dots)}\n')
+    
+    numbers = list(labels.keys())
+    
+    # Answer every label's nearest-dot query in one batch with a KD-tree
+    # (labels with no dot closer than max_distance get index len(dots))
+    if numbers and dots:
+        tree = cKDTree(np.asarray(dots, dtype=float))
+        label_coords = np.asarray([labels[n]['coords'] for n in numbers], dtype=float)
+        distances, indices = tree.query(label_coords, k=1, distance_upper_bound=max_distance)
+    else:
+        distances, indices = [], []
+    
+    selections = {} # dot index -> label number that claimed it
     successful_pairings = 0
-    for n, label in labels.items():
-        min_dist = 100
-        dot_selected = None
+    for n, dist, i in zip(numbers, distances, indices):
+        if i == len(dots):
+            continue
         
-        for dot in dots:
-            dist = distance.euclidean(dot, label['coords'])
-            if dist < min_dist:
-                label['dot_coords'] = dot
-                label['distance'] = dist
-                min_dist = dist
-                dot_selected = dot
+        label = labels[n]
+        label['dot_coords'] = dots[i]
+        label['distance'] = float(dist)
         
-        if dot_selected in dots_selected:
+        if i in selections:
+            label['verify'] = True
+            labels[selections[i]]['verify'] = True
             if debug:
-                print("WARNING: closest dot to label ", n, " already selected by dot ", selections[dot_selected])
-                label['verify'] = True
-                labels[selections[dot_selected]]['verify'] = True
+                print("WARNING: closest dot to label ", n, " already selected by label ", selections[i])
         else:
             successful_pairings += 1
         
-        dots_selected.append(dot_selected)
-        selections[dot_selected] = n
+        selections[i] = n
     
     if debug:
         if successful_pairings != len(dots):
@@ -249,14 +392,17 @@ def generate_assignments(labels, dots, debug=False):
                     print(f"Label {n}: coords ({label['coords'][0]:.1f}, {label['coords'][1]:.1f}) \t dot ({label['dot_coords'][0]:.1f}, {label['dot_coords'][1]:.1f}) \t (dist {label['distance']:.1f})")
             
             print("\nUnpaired dots")
-            for dot in dots:
-                if dot not in selections.keys():
+            for i, dot in enumerate(dots):
+                if i not in selections:
                     print(dot)
         else:
             print("All pairings successful!")
                 
+    # Labels without a dot in range have nothing to write
     assignments = []
     for n, label in labels.items():
+        if label['dot_coords'] is None:
+            continue
         assignment = {'n': n, 'coords': label['dot_coords']}
         assignments.append(assignment)
     
@@ -266,98 +412,159 @@ def extract_table_data(start_page, end_page, letter):
     print("--- extracting table data ---")
     print(f"Pages {start_page} to {end_page} (letter {letter})")
     
-    # Open the PDF
-    document = fitz.open(inventory_path)
-    text = ""
-    
-    # Extract text from specified page range
-    for page_num in range(start_page-1, end_page):
-        page = document.load_page(page_num)
-        text += page.get_text()
-        
-    text = ""
-    for page_num in range(start_page-1, end_page):  # Pages are 0-indexed in PyMuPDF
-        page = document.load_page(page_num)
-        text += page.get_text()
+    # Extract text from specified page range (pages are 0-indexed in PyMuPDF);
+    # the document and each page's text are shared with every other zone this run
+    text = get_pages_text(inventory_path, start_page-1, end_page)
 
     with open(f"zone_info/{letter}.txt", "w") as file:
         file.write(text)
 
-def process_table_data(letter, debug=False, edited=True):
+# Column headers repeated at the top of every table page in the inventory
+table_header_lines = {
+    "TREE LIST FOR THE ST. PAUL'S GROUNDS",
+    "Horticultural Observations",
+    "Tree #",
+    "Botanical Name",
+    "Common Name",
+    "DBH",
+    "(inches)",
+    "General",
+    "Health  (3)",
+    "Memorial Tree",
+    "Notes",
+}
+
+tree_id_pattern = re.compile(r"[A-Z]-\d{3}")
+botanical_pattern = re.compile(r"\w+\s+\w")
+health_pattern = re.compile(r"[A-Z]+")
+dbh_pattern = re.compile(r"(\d+(?:\.\d+)?)\s*\"?")
+
+table_columns = ["Tree ID", "Numerical ID", "Botanical Name", "Common Name", "DBH (inches)", "DBH Info", "General Health", "Notes"]
+
+def parse_table_lines(lines, dbh_default=8):
+    """
+    Parse tree table text in a single pass, one line at a time.
+
+    A row starts at a tree ID line (e.g. A-001) and is followed by the botanical name,
+    common name, DBH and general health lines. Any remaining lines up to the next tree
+    ID (memorial names and notes) are joined into Notes. Page header lines are skipped,
+    and a one-word botanical name is joined with the line after it.
+
+    Args:
+    - lines (iterable): Lines of table text (a file object works, so it can stream).
+    - dbh_default (float): DBH used when the DBH cell isn't a plain number.
+
+    Returns:
+    - (table, issues) (tuple): DataFrame with one typed column per field, and a list of
+      {'line', 'tree_id', 'message'} dicts describing malformed rows (line numbers start at 1).
+    """
+    columns = {column: [] for column in table_columns}
+    issues = []
+    
+    row = None # [line number, tree ID, field lines]
+    
+    def finish_row():
+        line_num, tree_id, fields = row
+        
+        def report(message):
+            issues.append({'line': line_num, 'tree_id': tree_id, 'message': message})
+        
+        if len(fields) < 4:
+            report(f"expected at least 4 fields after the tree ID, found {len(fields)}")
+            return
+        
+        # Long botanical names wrap onto a second line (e.g. Metasequoia / glyptostroboides)
+        if not botanical_pattern.match(fields[0]) and len(fields) >= 5:
+            fields = [f"{fields[0]} {fields[1]}"] + fields[2:]
+        
+        botanical, common, dbh_str, health = fields[:4]
+        if not botanical_pattern.match(botanical):
+            report(f"botanical name {botanical!r} is not two words")
+            return
+        if not health_pattern.fullmatch(health):
+            report(f"general health {health!r} is not a rating")
+            return
+        
+        dbh_match = dbh_pattern.fullmatch(dbh_str)
+        if dbh_match:
+            dbh = float(dbh_match.group(1))
+        else:
+            dbh = dbh_default
+            report(f"DBH {dbh_str!r} is not a number, using {dbh_default}")
+        
+        columns["Tree ID"].append(tree_id)
+        columns["Numerical ID"].append(int(tree_id.split('-')[1]))
+        columns["Botanical Name"].append(botanical)
+        columns["Common Name"].append(common)
+        columns["DBH (inches)"].append(dbh)
+        columns["DBH Info"].append(dbh_str)
+        columns["General Health"].append(health)
+        columns["Notes"].append(" ".join(fields[4:]))
+    
+    for line_num, line in enumerate(lines, start=1):
+        line = line.strip()
+        
+        if tree_id_pattern.fullmatch(line):
+            if row:
+                finish_row()
+            row = [line_num, line, []]
+        elif row and line and line not in table_header_lines:
+            row[2].append(line)
+    
+    if row:
+        finish_row()
+    
+    table = pd.DataFrame(columns)
+    table = table.astype({"Numerical ID": "int64", "DBH (inches)": "float64"})
+    return table, issues
+
+def process_table_data(letter, debug=False, edited=True, as_frame=False):
     if edited:
         dir = "zone_info/tables_edited"
     else:
         dir = "zone_info"
         
     with open(f"{dir}/{letter}.txt", "r") as file:
-        text = file.read()
-        
-    # Define a regex pattern to match table rows
-    pattern = re.compile(r"""
-    ([A-Z]-\d{3})\n            # Matches the Tree ID: A letter followed by a dash and three digits, followed by a newline
-    (\w+\s+\w.*?)\n            # Matches the Botanical Name: Two words separated by a space, maybe with a period
-    (.*?)\n                    # Matches the Common Name: Any characters, captured non-greedily, followed by a newline
-    (.*?)\n                    # Matches the DBH: anything because formatting is wack
-    ([A-Z]+)\n                 # Matches the General Health: One or more uppercase letters, followed by a newline
-    (.*?(?=\n[A-Z]-\d{3}))?    # Matches the Notes: Any characters, captured non-greedily, followed by a newline
-    """, re.VERBOSE)
-    
-    matches = pattern.findall(text)
-
-    # Create a list of dictionaries to hold table data
-    table_data = []
-    for match in matches:
-        tree_id = match[0]
-        numerical_id = int(tree_id.split('-')[1])
-        dbh_str = match[3].strip()
-        try:
-            dbh = float(dbh_str)
-        except ValueError:
-            dbh = 8
+        table, issues = parse_table_lines(file)
+    
+    if issues:
+        print(f"WARNING: {len(issues)} malformed rows in {dir}/{letter}.txt")
         
-        table_data.append({
-            "Tree ID": tree_id,
-            "Numerical ID": numerical_id,
-            "Botanical Name": match[1].strip(),
-            "Common Name": match[2].strip(),
-            "DBH (inches)": dbh,
-            "DBH Info": dbh_str,
-            "General Health": match[4].strip(),
-            "Notes": match[5].strip()
-        })
-
     if debug:
         print('--- process_table_data debug ---')
-        for row in table_data:
-            print(row)
-        print('Count:', len(table_data))
-        
-    return table_data
+        for issue in issues:
+            print(f"Line {issue['line']} ({issue['tree_id']}): {issue['message']}")
+        print(table.to_string())
+        print('Count:', len(table))
+    
+    if as_frame:
+        return table
+    
+    # List of dictionaries, one per row, as save_geojson expects
+    return table.to_dict('records')
 
-def process_zone(letter, debug=[], write=None, extract_table=False, pdf=False):
-    print(f"--- Processing zone {letter} with debug={debug}, write={write}, extract_table={extract_table}, pdf={pdf} ---\n")
+def process_zone(letter, debug=[], write=None, extract_table=False, pdf=False, assignment_mode='greedy'):
+    print(f"--- Processing zone {letter} with debug={debug}, write={write}, extract_table={extract_table}, pdf={pdf}, assignment_mode={assignment_mode} ---\n")
     if letter not in zones.keys():
         ValueError(f"Zone {letter} not supported (supported: {zones.keys()})")
         
     zone = zones[letter]
         
     # Extract text and vector graphics from the PDF
-    doc = fitz.open(inventory_path)
-
-    page = doc[zone['map_page'] - 1] # page_num is NOT zero-indexed
+    page = get_page(inventory_path, zone['map_page'] - 1) # page_num is NOT zero-indexed
             
     # Extract vector graphics (dots)
-    vector_graphics = page.get_drawings()
+    vector_graphics = get_drawings(page)
 
     # Filter text blocks to get the labels and their positions
     dots = extract_dots(vector_graphics, letter, 'dots' in debug)
     
     # Extract text blocks
-    text_blocks = page.get_text("dict")
+    text_blocks = get_text_dict(page)
     labels = extract_labels(text_blocks, letter, len(dots), 'labels' in debug)
     
     # Assign text to dots
-    assignments = generate_assignments(labels, dots, 'assignments' in debug)
+    assignments = generate_assignments(labels, dots, 'assignments' in debug, mode=assignment_mode)
     
     # Extract table data from PDF if not done already
     if not os.path.exists(f"zone_info/{letter}.txt") or extract_table:
@@ -408,30 +615,222 @@ def process_zone(letter, debug=[], write=None, extract_table=False, pdf=False):
     
     if pdf:
         create_zone_overlay(letter, zone['map_page'])
+    
+    return {'letter': letter, 'assignments': assignments, 'table_data': table_data}
             
-def combine_geojson_files():
-    combined_features = []
-
+def combine_geojson_files(indent=None, precision=None, compress=True):
     # Use glob to find all files matching the pattern
+    # (sorted so the combined file is the same no matter what order zones finished in)
     file_pattern = os.path.join('tree_extractions', "zone_*.geojson")
-    geojson_files = glob.glob(file_pattern)
-
-    # Iterate through each file and combine features
-    for file_path in geojson_files:
-        with open(file_path, 'r') as file:
-            geojson_data = json.load(file)
-            combined_features.extend(geojson_data['features'])
-
-    # Create a combined GeoJSON feature collection
-    combined_geojson = {
-        "type": "FeatureCollection",
-        "features": combined_features
-    }
+    geojson_files = sorted(glob.glob(file_pattern))
+
+    # Stream features from each zone file straight into the combined file,
+    # so only one zone is held in memory at a time
+    with FeatureCollectionWriter("tree_extractions/all_trees.geojson", indent, precision) as writer:
+        for file_path in geojson_files:
+            with open(file_path, 'r') as file:
+                geojson_data = json.load(file)
+            writer.write_all(geojson_data['features'])
     
-    with open("tree_extractions/all_trees.geojson", 'w') as output_file:
-        json.dump(combined_geojson, output_file, indent=2)
+    if compress:
+        precompress("tree_extractions/all_trees.geojson")
+
+# Fingerprints of each zone's stage inputs from the last incremental build
+build_state_path = 'tree_extractions/build_state.json'
+
+def fingerprint(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def file_fingerprint(path):
+    return file_hash(path) if os.path.exists(path) else None
+
+def load_build_state():
+    if not os.path.exists(build_state_path):
+        return {}
+    with open(build_state_path, 'r') as file:
+        return json.load(file)
+
+def save_build_state(state):
+    with open(build_state_path, 'w') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+
+def load_zone_info(letter):
+    info_path = f'zone_info/{letter}.json'
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, 'r') as file:
+        return json.load(file)
+
+def build_zone(letter, state, assignment_mode='greedy', debug=[], force=False):
+    """
+    Rebuild only the stages of a zone whose inputs changed since the last build.
+
+    Stages and the inputs they're fingerprinted on:
+    - assignments (zone_{letter}.json): the map page of the inventory PDF,
+      extra_labels in zone_info/{letter}.json and the assignment mode.
+    - geojson (zone_{letter}.geojson): the assignments file, zone_info/tables_edited/{letter}.txt
+      and the bounds in zone_info/{letter}.json.
+
+    Args:
+    - letter (str): Zone letter.
+    - state (dict): Build state from load_build_state (updated in place).
+    - assignment_mode (str): 'greedy' or 'optimal' (see generate_assignments).
+    - debug (list): Debug sections passed through to the extraction functions.
+    - force (bool): Rebuild every stage regardless of fingerprints.
 
-def process_all(letters=None, **kwargs):
+    Returns:
+    - rebuilt (list): Names of the stages that were rebuilt.
+    """
+    if letter not in zones.keys():
+        raise ValueError(f"Zone {letter} not supported (supported: {zones.keys()})")
+    
+    zone = zones[letter]
+    zone_state = state.setdefault(letter, {})
+    assignments_path = f'tree_extractions/zone_{letter}.json'
+    geo_path = f'tree_extractions/zone_{letter}.geojson'
+    table_path = f'zone_info/tables_edited/{letter}.txt'
+    rebuilt = []
+    
+    def assignments_fingerprint():
+        info = load_zone_info(letter)
+        extra_labels = info['extra_labels'] if info else None
+        return fingerprint(file_fingerprint(inventory_path), zone['map_page'], EXTRACTOR_VERSION, extra_labels, assignment_mode)
+    
+    if force or not os.path.exists(assignments_path) or zone_state.get('assignments') != assignments_fingerprint():
+        print(f"--- Zone {letter}: rebuilding assignments ---")
+        page = get_page(inventory_path, zone['map_page'] - 1) # page_num is NOT zero-indexed
+        dots = extract_dots(get_drawings(page), letter, 'dots' in debug)
+        labels = extract_labels(get_text_dict(page), letter, len(dots), 'labels' in debug)
+        assignments = generate_assignments(labels, dots, 'assignments' in debug, mode=assignment_mode)
+        
+        with open(assignments_path, 'w') as file:
+            json.dump({'assignments': assignments}, file)
+        
+        # extract_dots may have just created the zone info file, so fingerprint afterwards
+        zone_state['assignments'] = assignments_fingerprint()
+        rebuilt.append('assignments')
+    
+    bounds = load_zone_info(letter)['bounds']
+    geo_fingerprint = fingerprint(file_fingerprint(assignments_path), file_fingerprint(table_path), bounds, letter == 'e')
+    
+    if force or not os.path.exists(geo_path) or zone_state.get('geojson') != geo_fingerprint:
+        print(f"--- Zone {letter}: rebuilding geojson ---")
+        with open(assignments_path, 'r') as file:
+            assignments = json.load(file)['assignments']
+        table_data = process_table_data(letter, 'table' in debug)
+        save_geojson(assignments, bounds, table_data, geo_path, zone_e=(letter == 'e'))
+        
+        zone_state['geojson'] = geo_fingerprint
+        rebuilt.append('geojson')
+    
+    return rebuilt
+
+def patch_combined_geojson(letters, indent=None):
+    """
+    Replace the features of the given zones in all_trees.geojson with the current
+    zone files, leaving every other zone's features as they are.
+    """
+    combined_path = "tree_extractions/all_trees.geojson"
+    if not os.path.exists(combined_path):
+        combine_geojson_files(indent)
+        return
+    
+    # Group the existing features by zone (first letter of the tree ID)
+    with open(combined_path, 'r') as file:
+        features = json.load(file)['features']
+    groups = {}
+    for feature in features:
+        groups.setdefault(feature['properties']['Tree ID'][0].lower(), []).append(feature)
+    
+    for letter in letters:
+        with open(f'tree_extractions/zone_{letter}.geojson', 'r') as file:
+            groups[letter] = json.load(file)['features']
+    
+    # Keep the same zone order combine_geojson_files uses
+    with FeatureCollectionWriter(combined_path, indent) as writer:
+        for letter in sorted(groups):
+            writer.write_all(groups[letter])
+    precompress(combined_path)
+
+def build_all(letters=None, assignment_mode='greedy', debug=[], force=False):
+    """
+    Incrementally rebuild zones, then patch all_trees.geojson with the zones whose
+    GeoJSON changed. Returns the rebuilt stages keyed by zone letter.
+    """
+    if letters == None:
+        letters = zones.keys()
+    
+    state = load_build_state()
+    rebuilt = {}
+    try:
+        for letter in sorted(letters):
+            rebuilt[letter] = build_zone(letter, state, assignment_mode, debug, force)
+    finally:
+        # Keep fingerprints for stages that finished even if a later zone fails
+        save_build_state(state)
+    
+    changed = [letter for letter, stages in rebuilt.items() if 'geojson' in stages]
+    if changed:
+        patch_combined_geojson(changed)
+    else:
+        print("All zones up to date")
+    
+    return rebuilt
+
+def _process_zone_worker(letter, kwargs):
+    # Runs in a pool worker, which keeps its own document pool (see page_cache.get_document)
+    return process_zone(letter, **kwargs)
+
+def process_zone_batch(letters=None, workers=None, debug=[], extract_table=False, pdf=False, assignment_mode='greedy'):
+    """
+    Process several zones in parallel without any input() prompts.
+
+    Each zone runs in its own worker process (one per zone unless workers is given),
+    so the whole inventory takes about as long as the slowest zone. Assignments and
+    GeoJSON are always written, and all_trees.geojson is rebuilt from the zone files
+    in sorted zone order once every worker has finished.
+
+    Args:
+    - letters (list): Zones to process (defaults to every zone).
+    - workers (int): Maximum number of worker processes.
+    - debug (list): Debug sections passed through to process_zone.
+    - extract_table (bool): Re-extract table text from the PDF.
+    - pdf (bool): Also write pdf_overlays/all_zones.pdf, one proof page per zone (done after the pool finishes).
+    - assignment_mode (str): 'greedy' or 'optimal' (see generate_assignments).
+
+    Returns:
+    - results (dict): process_zone results keyed by zone letter, in zone order.
+    """
+    if letters == None:
+        letters = zones.keys()
+    letters = sorted(letters)
+    
+    for letter in letters:
+        if letter not in zones.keys():
+            raise ValueError(f"Zone {letter} not supported (supported: {zones.keys()})")
+        
+    kwargs = {'debug': debug, 'write': True, 'extract_table': extract_table, 'pdf': False, 'assignment_mode': assignment_mode}
+    with ProcessPoolExecutor(max_workers=workers or len(letters)) as executor:
+        # map keeps results in submission order, so merging is deterministic
+        results = list(executor.map(_process_zone_worker, letters, [kwargs] * len(letters)))
+    
+    # One proof PDF for every zone, rendered from the assignments already in memory
+    if pdf:
+        zone_pages = {letter: zones[letter]['map_page'] for letter in letters}
+        create_proof_pdf(zone_pages, assignments={result['letter']: result['assignments'] for result in results})
+    
+    combine_geojson_files()
+    
+    return {result['letter']: result for result in results}
+
+def process_all(letters=None, batch=False, workers=None, **kwargs):
+    if batch:
+        return process_zone_batch(letters, workers, **kwargs)
+    
     if letters == None:
         letters = zones.keys()
         
@@ -441,6 +840,11 @@ def process_all(letters=None, **kwargs):
     answer = input('Combine geojson files? (y/n)')
     if answer in ['y', 'yes', 'Y', 'YES']:
         combine_geojson_files()
-        
-letters = ['e']
-process_all(write=True)
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Usage: python extract_trees.py [--batch]
+    # --batch processes every zone in parallel and writes the combined GeoJSON without asking
+    if '--batch' in sys.argv:
+        process_all(batch=True)
+    else:
+        process_all(write=True)
\ No newline at end of file
@@ -0,0 +1,106 @@
+import json
+import os
+
+def round_coordinates(coordinates, precision):
+    # Round every number in a (possibly nested) GeoJSON coordinates array
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, precision) for value in coordinates]
+    return [round_coordinates(part, precision) for part in coordinates]
+
+def round_geometry(geometry, precision):
+    if geometry is None:
+        return None
+    if geometry['type'] == 'GeometryCollection':
+        return {**geometry, 'geometries': [round_geometry(part, precision) for part in geometry['geometries']]}
+    return {**geometry, 'coordinates': round_coordinates(geometry['coordinates'], precision)}
+
+class FeatureCollectionWriter:
+    """
+    Write a GeoJSON FeatureCollection to disk one feature at a time.
+
+    Features are serialized as they arrive, so memory use doesn't grow with the
+    size of the layer. With indent=None (the default) the output is compact; with
+    an indent the file looks the same as json.dump(collection, f, indent=indent).
+    The file is written under a temporary name and only renamed to path once the
+    collection is closed, so if the block raises, path is left as it was instead
+    of holding a truncated but valid collection.
+    With a precision, coordinates are rounded to that many decimal places (6 is
+    about 10 cm, 7 about 1 cm), which cuts the file size roughly in half for
+    layers digitized from a PDF.
+
+    Usage:
+        with FeatureCollectionWriter('features.geojson') as writer:
+            for feature in features:
+                writer.write(feature)
+    """
+    def __init__(self, path, indent=None, precision=None):
+        self.path = path
+        self.indent = indent
+        self.precision = precision
+        self.count = 0
+        self.file = None
+        self.tmp_path = f'{path}.{os.getpid()}.tmp'
+
+        if indent is None:
+            self.separators = (',', ':')
+            self.newline = ''
+            self.prefix = ''
+        else:
+            self.separators = (',', ': ')
+            self.newline = '\n'
+            self.prefix = ' ' * indent
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, 'w')
+        self.file.write('{' + self.newline + self.prefix + json.dumps('type') + self.separators[1] +
+                        json.dumps('FeatureCollection') + ',' + self.newline + self.prefix +
+                        json.dumps('features') + self.separators[1] + '[')
+        return self
+
+    def write(self, feature):
+        if self.precision is not None and feature.get('geometry'):
+            feature = {**feature, 'geometry': round_geometry(feature['geometry'], self.precision)}
+
+        text = json.dumps(feature, indent=self.indent, separators=self.separators)
+        if self.indent is not None:
+            # Nest the feature two levels deep (collection -> features list)
+            text = text.replace('\n', '\n' + self.prefix * 2)
+
+        self.file.write((',' if self.count else '') + self.newline + self.prefix * 2 + text)
+        self.count += 1
+
+    def write_all(self, features):
+        for feature in features:
+            self.write(feature)
+
+    def close(self):
+        if self.file is None:
+            return
+
+        closing = ']' if self.count == 0 else self.newline + self.prefix + ']'
+        self.file.write(closing + self.newline + '}')
+        self.file.close()
+        self.file = None
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        # Drop a partly written collection, leaving path untouched
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        os.remove(self.tmp_path)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+'''
+Write an iterable of features to a GeoJSON file without building the collection in memory.
+'''
+def write_feature_collection(features, path, indent=None, precision=None):
+    with FeatureCollectionWriter(path, indent, precision) as writer:
+        writer.write_all(features)
+        return writer.count
@@ -0,0 +1,246 @@
+import json
+import os
+import numpy as np
+
+'''
+Compact binary storage for extracted PDF drawings and GeoJSON layers.
+
+A store is a directory (by convention ending in .geom) holding flat NumPy arrays,
+laid out like FlatGeobuf: every coordinate in one array, with offset arrays that
+say where each part and each feature starts.
+
+    coords.npy           (N, 2) float64   every point, in order
+    part_offsets.npy     (P + 1,) int64   part i is coords[part_offsets[i]:part_offsets[i + 1]]
+    part_kinds.npy       (P,) uint16      drawings: item kind code (plus orientation flags for 're');
+                                          GeoJSON: polygon number within the feature
+    feature_offsets.npy  (F + 1,) int64   feature j is parts[feature_offsets[j]:feature_offsets[j + 1]]
+    feature_kinds.npy    (F,) uint8       drawings: 0; GeoJSON: geometry type code (null geometries have no parts)
+    properties.json      store kind, per-feature attributes (everything except geometry) and GeoJSON ids
+
+The arrays are plain .npy files, so load_store can memory-map them: opening a store
+only reads the header of each array, and coordinates are paged in as they're used.
+
+Usage:
+    save_drawings(features, 'features.geom')
+    store = load_store('features.geom')
+    store.segments()    # (S, 2, 2) array of every 'l' segment
+    list(store)         # drawings in the same form as features.json
+'''
+
+# Drawing item kinds (see jsonify_features)
+item_kinds = ['l', 'c', 're', 'qu', 'unknown']
+
+# Flags on an 're' item's kind code for the rect orientation get_drawings gives as a third element
+# (['re', rect, orientation]); rects without one round-trip without one
+kind_mask = 0xff
+has_orientation = 0x100
+negative_orientation = 0x200
+
+# GeoJSON geometry types (None for a feature with a null geometry)
+geometry_kinds = ['Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon', None]
+
+array_names = ['coords', 'part_offsets', 'part_kinds', 'feature_offsets', 'feature_kinds']
+
+def is_store(path):
+    return isinstance(path, str) and os.path.isfile(os.path.join(path, 'properties.json'))
+
+def _item_points(item):
+    kind = item[0]
+    if kind == 'l' or kind == 'c':
+        return [tuple(point) for point in item[1:]]
+    if kind == 'qu':
+        return [tuple(point) for point in item[1]]
+    if kind == 're':
+        x0, y0, x1, y1 = item[1]
+        return [(x0, y0), (x1, y1)]
+    return []
+
+def _write(path, kind, coords, part_offsets, part_kinds, feature_offsets, feature_kinds, properties, ids=None):
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        'coords': np.asarray(coords, dtype=np.float64).reshape(-1, 2),
+        'part_offsets': np.asarray(part_offsets, dtype=np.int64),
+        'part_kinds': np.asarray(part_kinds, dtype=np.uint16),
+        'feature_offsets': np.asarray(feature_offsets, dtype=np.int64),
+        'feature_kinds': np.asarray(feature_kinds, dtype=np.uint8),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), array)
+
+    with open(os.path.join(path, 'properties.json'), 'w') as f:
+        json.dump({'kind': kind, 'properties': properties, 'ids': ids}, f, separators=(',', ':'))
+
+def save_drawings(features, path):
+    """
+    Save PDF drawings (get_drawings() or jsonify_features output) as a store.
+    """
+    coords = []
+    part_offsets = [0]
+    part_kinds = []
+    feature_offsets = [0]
+    properties = []
+
+    for feature in features:
+        for item in feature['items']:
+            kind = item[0] if item[0] in item_kinds else 'unknown'
+            code = item_kinds.index(kind)
+            if kind == 're' and len(item) > 2:
+                code |= has_orientation | (negative_orientation if item[2] < 0 else 0)
+            coords.extend(_item_points(item))
+            part_offsets.append(len(coords))
+            part_kinds.append(code)
+        feature_offsets.append(len(part_kinds))
+
+        attributes = {key: (list(value) if isinstance(value, tuple) else value) for key, value in feature.items() if key != 'items'}
+        properties.append(attributes)
+
+    _write(path, 'drawings', coords, part_offsets, part_kinds, feature_offsets, [0] * len(properties), properties)
+
+def _geometry_parts(geometry):
+    # (polygon number, positions) for each part of a geometry
+    if geometry is None:
+        return []
+    kind = geometry['type']
+    coordinates = geometry['coordinates']
+    if kind == 'Point':
+        return [(0, [coordinates])]
+    if kind in ('MultiPoint', 'LineString'):
+        return [(0, coordinates)]
+    if kind in ('MultiLineString', 'Polygon'):
+        return [(0, part) for part in coordinates]
+    if kind == 'MultiPolygon':
+        return [(i, ring) for i, polygon in enumerate(coordinates) for ring in polygon]
+    raise ValueError(f"Geometry type {kind} not supported (supported: {geometry_kinds[:-1]} or null)")
+
+def save_geojson_store(geojson_data, path):
+    """
+    Save a GeoJSON FeatureCollection as a store.
+    """
+    coords = []
+    part_offsets = [0]
+    part_kinds = []
+    feature_offsets = [0]
+    feature_kinds = []
+    properties = []
+    ids = []
+
+    for feature in geojson_data['features']:
+        geometry = feature['geometry']
+        for polygon, positions in _geometry_parts(geometry):
+            coords.extend(position[:2] for position in positions)
+            part_offsets.append(len(coords))
+            part_kinds.append(polygon)
+        feature_offsets.append(len(part_kinds))
+        feature_kinds.append(geometry_kinds.index(geometry['type'] if geometry is not None else None))
+        properties.append(feature.get('properties') or {})
+        ids.append(feature.get('id'))
+
+    # Only keep feature ids if the layer actually uses them
+    if all(i is None for i in ids):
+        ids = None
+
+    _write(path, 'geojson', coords, part_offsets, part_kinds, feature_offsets, feature_kinds, properties, ids)
+
+class GeometryStore:
+    """
+    Read access to a store written by save_drawings or save_geojson_store.
+    Iterating, indexing and slicing give features in their original form (drawing dicts
+    or GeoJSON features), so a store can stand in for the list it was saved from.
+    """
+    def __init__(self, path, mmap=True):
+        self.path = path
+        mode = 'r' if mmap else None
+        for name in array_names:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode))
+
+        with open(os.path.join(path, 'properties.json'), 'r') as f:
+            data = json.load(f)
+        self.kind = data['kind']
+        self.properties = data['properties']
+        self.ids = data.get('ids')
+
+    def __len__(self):
+        return len(self.feature_offsets) - 1
+
+    def part(self, i):
+        return self.coords[self.part_offsets[i]:self.part_offsets[i + 1]]
+
+    def segments(self):
+        """
+        Every 'l' item of a drawing store as an (S, 2, 2) array, without building any dicts.
+        """
+        lines = np.flatnonzero(np.asarray(self.part_kinds) == item_kinds.index('l'))
+        starts = np.asarray(self.part_offsets)[lines]
+        coords = np.asarray(self.coords)
+        return np.stack([coords[starts], coords[starts + 1]], axis=1)
+
+    def _drawing(self, j):
+        items = []
+        for i in range(self.feature_offsets[j], self.feature_offsets[j + 1]):
+            code = int(self.part_kinds[i])
+            kind = item_kinds[code & kind_mask]
+            points = self.part(i).tolist()
+            if kind == 'l' or kind == 'c':
+                items.append([kind, *points])
+            elif kind == 'qu':
+                items.append([kind, points])
+            elif kind == 're':
+                item = [kind, points[0] + points[1]]
+                if code & has_orientation:
+                    item.append(-1 if code & negative_orientation else 1)
+                items.append(item)
+            else:
+                items.append(['unknown', []])
+        return {'items': items, **self.properties[j]}
+
+    def _feature(self, j):
+        kind = geometry_kinds[self.feature_kinds[j]]
+        if kind is None:
+            feature = {"type": "Feature", "geometry": None, "properties": self.properties[j]}
+            if self.ids and self.ids[j] is not None:
+                feature["id"] = self.ids[j]
+            return feature
+
+        parts = [(int(self.part_kinds[i]), self.part(i).tolist()) for i in range(self.feature_offsets[j], self.feature_offsets[j + 1])]
+
+        if kind == 'Point':
+            coordinates = parts[0][1][0]
+        elif kind in ('MultiPoint', 'LineString'):
+            coordinates = parts[0][1]
+        elif kind in ('MultiLineString', 'Polygon'):
+            coordinates = [positions for polygon, positions in parts]
+        else:
+            coordinates = []
+            for polygon, positions in parts:
+                if polygon == len(coordinates):
+                    coordinates.append([])
+                coordinates[polygon].append(positions)
+
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": kind, "coordinates": coordinates},
+            "properties": self.properties[j]
+        }
+        if self.ids and self.ids[j] is not None:
+            feature["id"] = self.ids[j]
+        return feature
+
+    def __getitem__(self, j):
+        # Indexes and slices work as on the list the store was saved from
+        if isinstance(j, slice):
+            return [self[i] for i in range(*j.indices(len(self)))]
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError(f"Feature {j} is out of range ({len(self)} features)")
+        return self._drawing(j) if self.kind == 'drawings' else self._feature(j)
+
+    def __iter__(self):
+        for j in range(len(self)):
+            yield self[j]
+
+'''
+Open a store, memory-mapping its arrays unless mmap is False.
+'''
+def load_store(path, mmap=True):
+    return GeometryStore(path, mmap)
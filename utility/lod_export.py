@@ -0,0 +1,138 @@
+import json
+import math
+import os
+from clean_coords import simplify_features, EARTH_RADIUS
+from geojson_writer import FeatureCollectionWriter
+
+'''
+Multi-resolution (level of detail) export for GeoJSON layers.
+
+A layer written by features_to_geojson or save_geojson is simplified once per zoom
+level, at a tolerance of about one screen pixel at that zoom, and written to its own
+file. A manifest lists which file covers which zoom range, so a map can load the
+small overview first and swap in more detail as the user zooms in.
+
+Usage:
+    export_lods('features.geojson', 'lod', zooms=[14, 16, 18])
+
+writes lod/features.z14.geojson, lod/features.z16.geojson, lod/features.z18.geojson
+and lod/features.manifest.json.
+'''
+
+# Web Mercator ground resolution at the equator for zoom 0, in meters per 256px tile pixel
+METERS_PER_PIXEL_Z0 = 156543.03392
+
+default_zooms = [14, 16, 18]
+
+def tolerance_for_zoom(zoom, lat, pixels=1.0):
+    """
+    Tolerance in meters that corresponds to a number of screen pixels at a zoom level.
+    """
+    return pixels * METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / 2 ** zoom
+
+def _coordinates(geometry):
+    # Every [lon, lat] position in a geometry, flattened (none for a null geometry)
+    if not geometry:
+        return []
+    if geometry['type'] == 'GeometryCollection':
+        return [position for part in geometry['geometries'] for position in _coordinates(part)]
+    coordinates = geometry['coordinates']
+    depth = {'Point': 0, 'MultiPoint': 1, 'LineString': 1, 'MultiLineString': 2, 'Polygon': 2, 'MultiPolygon': 3}[geometry['type']]
+    if depth == 0:
+        return [coordinates]
+    for _ in range(depth - 1):
+        coordinates = [position for part in coordinates for position in part]
+    return coordinates
+
+def layer_latitude(features):
+    # Center latitude of the layer, used to convert pixels to meters
+    lats = [position[1] for feature in features for position in _coordinates(feature.get('geometry'))]
+    return (min(lats) + max(lats)) / 2 if lats else 0
+
+def _extent(geometry):
+    coordinates = _coordinates(geometry)
+    if not coordinates:
+        return 0
+    lons = [position[0] for position in coordinates]
+    lats = [position[1] for position in coordinates]
+    # Rough size in meters of the feature's bounding box diagonal
+    scale = math.radians(1) * EARTH_RADIUS
+    dx = (max(lons) - min(lons)) * scale * math.cos(math.radians(lats[0]))
+    dy = (max(lats) - min(lats)) * scale
+    return math.hypot(dx, dy)
+
+def drop_small_features(features, min_size):
+    """
+    Yield features whose bounding box is at least min_size meters across (points always pass).
+    """
+    for feature in features:
+        geometry = feature.get('geometry')
+        if not geometry or geometry['type'] in ('Point', 'MultiPoint') or _extent(geometry) >= min_size:
+            yield feature
+
+def export_lods(layer_path, outdir, zooms=default_zooms, mode='dp', pixels=1.0, drop_small=True, indent=None):
+    """
+    Write one simplified copy of a layer per zoom level, plus a manifest.
+
+    Args:
+    - layer_path (str): GeoJSON FeatureCollection to export.
+    - outdir (str): Directory for the LOD files and manifest.
+    - zooms (list): Zoom levels to export. Each file is used from its zoom up to the next one;
+      the highest zoom is written at full resolution.
+    - mode (str): Simplification mode, 'dp' or 'vw' (see clean_coords).
+    - pixels (float): Tolerance in screen pixels at each zoom.
+    - drop_small (bool): Leave out lines and polygons smaller than the tolerance.
+    - indent (int): Indent for the output files (compact by default).
+
+    Returns:
+    - manifest (dict): The manifest that was written.
+    """
+    with open(layer_path, 'r') as f:
+        features = json.load(f)['features']
+
+    os.makedirs(outdir, exist_ok=True)
+    layer = os.path.splitext(os.path.basename(layer_path))[0]
+    lat = layer_latitude(features)
+    zooms = sorted(zooms)
+
+    levels = []
+    for i, zoom in enumerate(zooms):
+        full_detail = i == len(zooms) - 1
+        tolerance = 0 if full_detail else tolerance_for_zoom(zoom, lat, pixels)
+
+        level_features = features
+        if tolerance:
+            level_features = simplify_features(level_features, tolerance, mode)
+            if drop_small:
+                level_features = drop_small_features(level_features, tolerance)
+
+        filename = f'{layer}.z{zoom}.geojson'
+        path = os.path.join(outdir, filename)
+        with FeatureCollectionWriter(path, indent) as writer:
+            writer.write_all(level_features)
+            count = writer.count
+
+        levels.append({
+            'file': filename,
+            'min_zoom': zoom if i > 0 else 0,
+            'max_zoom': zooms[i + 1] if not full_detail else None,
+            'tolerance_m': tolerance,
+            'features': count,
+            'bytes': os.path.getsize(path),
+        })
+
+    manifest = {
+        'layer': layer,
+        'source': os.path.basename(layer_path),
+        'mode': mode,
+        'levels': levels,
+    }
+    with open(os.path.join(outdir, f'{layer}.manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+if __name__ == "__main__":
+    manifest = export_lods('features.geojson', 'lod')
+    for level in manifest['levels']:
+        print(f"{level['file']}: {level['features']} features, {level['bytes']} bytes (tolerance {level['tolerance_m']:.2f} m)")
@@ -0,0 +1,161 @@
+import fitz  # PyMuPDF
+import hashlib
+import os
+import pickle
+import zlib
+
+'''
+On-disk cache for the expensive parts of reading a PDF page: page.get_drawings()
+and page.get_text("dict").
+
+Entries are keyed by the PDF's content hash, the page number and the extractor
+version, so editing the PDF (or upgrading PyMuPDF) invalidates them automatically.
+Documents, pages and page text are also kept in memory for the rest of the run
+(get_document, get_page, get_page_text), so several zones reading the same PDF open
+it and extract each page's text once.
+Each entry is a zlib-compressed pickle of plain Python values: PyMuPDF's Point, Rect
+and Quad objects are stored as tuples, which load several times faster than the
+objects themselves (and than re-running get_drawings()).
+'''
+
+CACHE_DIR = '.page_cache'
+
+# Bump this whenever the cached output of an extractor changes shape
+EXTRACTOR_VERSION = f'1-{fitz.VersionBind}'
+
+# Content hashes of PDFs already seen this run, keyed by (path, size, mtime)
+_hashes = {}
+
+def file_hash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+def cache_path(pdf_path, page_num, kind):
+    name = f'{file_hash(pdf_path)[:32]}-p{page_num}-{kind}-v{EXTRACTOR_VERSION}.pkl.z'
+    return os.path.join(CACHE_DIR, name)
+
+def _plain(value):
+    if isinstance(value, (fitz.Point, fitz.Rect)):
+        return tuple(value)
+    if isinstance(value, fitz.Quad):
+        return tuple(tuple(point) for point in value)
+    return value
+
+'''
+Converts the geometry objects in get_drawings() output to tuples (in place).
+'''
+def plain_drawings(drawings):
+    for drawing in drawings:
+        drawing['items'] = [tuple(_plain(value) for value in item) for item in drawing['items']]
+        drawing['rect'] = tuple(drawing['rect'])
+    return drawings
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.loads(zlib.decompress(f.read()))
+    except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+        return None
+
+def _save(path, value):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write to a temporary file first so a crash never leaves half an entry behind
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+    os.replace(tmp_path, path)
+
+def _cached(page, kind, extract, cache=True):
+    pdf_path = page.parent.name
+    if not cache or not pdf_path or not os.path.exists(pdf_path):
+        return extract()
+
+    path = cache_path(pdf_path, page.number, kind)
+    value = _load(path)
+    if value is None:
+        value = extract()
+        _save(path, value)
+    return value
+
+'''
+Cached replacement for page.get_drawings().
+Points and rects come back as tuples whether or not the cache is used.
+'''
+def get_drawings(page, cache=True):
+    return _cached(page, 'drawings', lambda: plain_drawings(page.get_drawings()), cache)
+
+'''
+Cached replacement for page.get_text("dict").
+'''
+def get_text_dict(page, cache=True):
+    return _cached(page, 'textdict', lambda: page.get_text("dict"), cache)
+
+# Documents opened this run, keyed by (path, size, mtime), and the pages and text loaded from them
+_documents = {}
+_pages = {}
+_page_text = {}
+
+def _document_key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+'''
+Open a PDF once per run; later calls return the same fitz.Document (reopened if the file changed).
+'''
+def get_document(path):
+    key = _document_key(path)
+    if key not in _documents:
+        _documents[key] = fitz.open(path)
+    return _documents[key]
+
+'''
+Load a page (zero-indexed) of a PDF once per run.
+'''
+def get_page(path, page_num):
+    key = (_document_key(path), page_num)
+    if key not in _pages:
+        _pages[key] = get_document(path).load_page(page_num)
+    return _pages[key]
+
+'''
+Plain text of a page (zero-indexed), extracted at most once per run and cached on disk like drawings.
+'''
+def get_page_text(path, page_num, cache=True):
+    key = (_document_key(path), page_num)
+    if key not in _page_text:
+        page = get_page(path, page_num)
+        _page_text[key] = _cached(page, 'text', page.get_text, cache)
+    return _page_text[key]
+
+'''
+Text of a range of pages (zero-indexed, end exclusive) joined in order.
+'''
+def get_pages_text(path, start, end, cache=True):
+    return ''.join(get_page_text(path, page_num, cache) for page_num in range(start, end))
+
+'''
+Close every document opened by get_document and forget their pages and text.
+'''
+def close_documents():
+    for document in _documents.values():
+        document.close()
+    _documents.clear()
+    _pages.clear()
+    _page_text.clear()
+
+'''
+Delete every cached entry.
+'''
+def clear_cache():
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        os.remove(os.path.join(CACHE_DIR, name))
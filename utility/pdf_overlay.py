@@ -5,44 +5,54 @@ from PyPDF2.generic import RectangleObject
 from io import BytesIO
 import json
 
-def create_dots_overlay(assignments, output_overlay_path):
+# The inventory map pages are 11x17 sheets, rotated in the PDF
+overlay_pagesize = (17*72, 11*72)
+
+def render_dots_overlay(assignments, pagesize=overlay_pagesize):
+    """
+    Render one text label for every dot into an in-memory PDF.
+
+    Args:
+    - assignments (list): Assignments with 'coords' (y, x) and 'n' for label text.
+    - pagesize (tuple): Overlay page size in points.
+
+    Returns:
+    - packet (BytesIO): The overlay PDF, positioned at the start.
+    """
     packet = BytesIO()
-    can = canvas.Canvas(packet, pagesize=(*72, 11*72))
-    
-    # create one text label for every dot
-    # assignments have 'coords' and 'n' for label text
+    can = canvas.Canvas(packet, pagesize=pagesize)
+
+    # Every label has the same color and font, so set them once
+    font_size = 4
+    can.setFillColorRGB(0, 0, 1)  # Bright blue color
+    can.setFont("Helvetica", font_size)
+    text_height = font_size  # Approximation of text height
+
     for assignment in assignments:
         label_coords = assignment['coords']
         label_text = str(assignment['n'])
-        can.setFillColorRGB(0, 0, 1)  # Bright blue color
-        
-        # Set font and size
-        font_size = 4
-        can.setFont("Helvetica", font_size)
-        
-        # Calculate width and height of the text to center it
+
+        # Calculate width of the text to center it
         text_width = can.stringWidth(label_text, "Helvetica", font_size)
-        text_height = font_size  # Approximation of text height
-        
+
         # Draw the text centered around the coordinates
         x = label_coords[1] - (text_width / 2)
         y = label_coords[0] - (text_height / 2)
         can.drawString(x, y, label_text)
-    
+
     can.save()
     packet.seek(0)
+    return packet
+
+def create_dots_overlay(assignments, output_overlay_path, pagesize=overlay_pagesize):
+    packet = render_dots_overlay(assignments, pagesize)
     with open(output_overlay_path, 'wb') as f:
         f.write(packet.getbuffer())
 
-def merge_pdfs(original_pdf_path, page_num, overlay_pdf_path, output_pdf_path, rotation=0):
-    original_pdf = PdfReader(original_pdf_path)
-    overlay_pdf = PdfReader(overlay_pdf_path)
-    writer = PdfWriter()
-    writer._header = b'%PDF-1.3\n'
-
-    original_page = original_pdf.pages[page_num]
-    overlay_page = overlay_pdf.pages[0]
-    
+def overlay_onto_page(original_page, overlay_page, rotation=0):
+    '''
+    Merge an overlay page onto a page of the original PDF, correcting for the original's rotation.
+    '''
     # Correct for rotation in the original pdf
     # Credit to this forum for this code:
     # https://github.com/py-pdf/pypdf/issues/1280
@@ -63,30 +73,94 @@ def merge_pdfs(original_pdf_path, page_num, overlay_pdf_path, output_pdf_path, r
     overlay_page.update({'/CropBox': RectangleObject([0, new_y, new_width, new_y + new_heigth])})
     overlay_page.update({'/MediaBox': RectangleObject([0, new_y, new_width, new_y + new_heigth])})
     overlay_page.update({'/TrimBox': RectangleObject([0, new_y, new_width, new_y + new_heigth])})
-    
+
     original_page.merge_page(overlay_page)
+    return original_page
+
+'''
+Merge page 0 of an overlay PDF (a path or an in-memory file) onto a page of the original PDF
+'''
+def merge_pdfs(original_pdf_path, page_num, overlay_pdf_path, output_pdf_path, rotation=0):
+    original_pdf = PdfReader(original_pdf_path)
+    overlay_pdf = PdfReader(overlay_pdf_path)
+    writer = PdfWriter()
+    writer._header = b'%PDF-1.3\n'
+
+    original_page = overlay_onto_page(original_pdf.pages[page_num], overlay_pdf.pages[0], rotation)
     writer.add_page(original_page)
 
     with open(output_pdf_path, 'wb') as f:
         writer.write(f)
 
+def load_zone_assignments(letter):
+    path = f'tree_extractions/zone_{letter}.json'
+    with open(path, 'r') as file:
+        return json.load(file)['assignments']
+
 '''
 Creates a PDF overlay of the assignments for a given zone on top of the tree inventory page
 '''
 def create_zone_overlay(letter, page_num):
     page_num_zero_indexed = page_num - 1
-    
-    path = f'tree_extractions/zone_{letter}.json'
-    with open(path, 'r') as file:
-        assignments = json.load(file)['assignments']
+
+    assignments = load_zone_assignments(letter)
 
     # Paths
     original_pdf_path = 'tree_inventory.pdf'
-    overlay_pdf_path = 'pdf_overlays/zone_c_overlay.pdf'
     output_pdf_path = f'pdf_overlays/zone_{letter}.pdf'
 
-    # Create the overlay PDF
-    create_dots_overlay(assignments, overlay_pdf_path)
+    # Create the overlay in memory, so zones never share a temporary file
+    overlay = render_dots_overlay(assignments)
 
     # Merge the overlay with the original PDF
-    merge_pdfs(original_pdf_path, page_num_zero_indexed, overlay_pdf_path, output_pdf_path, rotation=270)
\ No newline at end of file
+    merge_pdfs(original_pdf_path, page_num_zero_indexed, overlay, output_pdf_path, rotation=270)
+
+def create_proof_pdf(zone_pages, output_pdf_path='pdf_overlays/all_zones.pdf', assignments=None,
+                     original_pdf_path='tree_inventory.pdf', rotation=270):
+    """
+    Overlay every zone's labels on its map page and write them all to one proof PDF.
+
+    The original PDF is parsed once and overlays are rendered in memory, so there are
+    no temporary files and separate runs can't overwrite each other's overlays.
+
+    Args:
+    - zone_pages (dict): Map page number (not zero-indexed) for each zone letter.
+    - output_pdf_path (str): Path to the combined proof PDF.
+    - assignments (dict): Assignments for each zone letter; zones not given are read
+      from tree_extractions/zone_{letter}.json.
+    - original_pdf_path (str): The tree inventory PDF.
+    - rotation (int): Rotation of the map pages in the original PDF.
+
+    Returns:
+    - pages (list): The page numbers written, in order.
+    """
+    assignments = assignments or {}
+    original_pdf = PdfReader(original_pdf_path)
+    writer = PdfWriter()
+    writer._header = b'%PDF-1.3\n'
+
+    # Zones that share a map page get one overlay, so the page is only merged once
+    page_assignments = {}
+    for letter, page_num in zone_pages.items():
+        zone_assignments = assignments.get(letter)
+        if zone_assignments is None:
+            zone_assignments = load_zone_assignments(letter)
+        page_assignments.setdefault(page_num, []).extend(zone_assignments)
+
+    pages = sorted(page_assignments)
+    for page_num in pages:
+        original_page = original_pdf.pages[page_num - 1]
+
+        # The overlay is drawn unrotated, so its size is the page's size before rotation
+        width = float(original_page.mediabox.width)
+        height = float(original_page.mediabox.height)
+        pagesize = (height, width) if rotation % 180 else (width, height)
+
+        overlay = PdfReader(render_dots_overlay(page_assignments[page_num], pagesize))
+        writer.add_page(overlay_onto_page(original_page, overlay.pages[0], rotation))
+
+    with open(output_pdf_path, 'wb') as f:
+        writer.write(f)
+
+    print(f"Proof PDF with {len(pages)} zone pages written to {output_pdf_path}")
+    return pages
@@ -4,15 +4,24 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.colors import red
 from reportlab.pdfgen.pathobject import PDFPathObject
 from reportlab.lib.colors import Color
+import itertools
 import json
 from pdf_overlay import merge_pdfs
+from geojson_writer import write_feature_collection
+from precompress import precompress
+from page_cache import get_drawings, get_text_dict
+from drawing_scan import RED, match, scan_drawings
+from polylines import chain_segments
+from curves import dot_geometry, flatten_bezier
+from geometry_store import GeometryStore, is_store, load_store, save_drawings
 import math
+import numpy as np
 
 '''
 Print information about the text on an input PDF page.
 '''
 def print_page_text_info(page):
-    text_instances = page.get_text("dict")
+    text_instances = get_text_dict(page)
     count = 0
     
     # Function to print details about each text block
@@ -36,20 +45,17 @@ def color_info(pdf_path):
     # Open the PDF
     document = fitz.open(pdf_path)
     
-    # Initialize a dictionary to store colors and examples
-    color_examples = {}
-
-    # Iterate through pages
+    # Scan every page into one shared histogram
+    scan = None
     for page_num in range(len(document)):
         page = document.load_page(page_num)
-        for item in page.get_drawings():
-            # Get the color of the current item
-            color = item.get("color") or item.get("fill")
-            if color:
-                # Convert color to a tuple to use as a dictionary key
-                color_tuple = tuple(color)
-                if color_tuple not in color_examples:
-                    color_examples[color_tuple] = item
+        scan = scan_drawings(get_drawings(page), scan=scan)
+    
+    # Keep one example per color (across drawing types)
+    color_examples = {}
+    for (item_type, color), example in scan['examples'].items():
+        if color and color not in color_examples:
+            color_examples[color] = example
 
     # Display the colors and examples
     print("Colors and Examples:")
@@ -57,6 +63,19 @@ def color_info(pdf_path):
         print(f"Color: {color}")
         print(f"Example: {example}")
         print()
+
+'''
+Count the drawings on a page by (type, color) in one pass.
+'''
+def drawing_histogram(page):
+    return scan_drawings(get_drawings(page))['histogram']
+
+'''
+Split the drawings on a page into several groups in one pass.
+Buckets map a name to a predicate from drawing_scan.match; returns name -> list of drawings.
+'''
+def extract_drawing_buckets(page, buckets):
+    return scan_drawings(get_drawings(page), buckets)['buckets']
         
 '''
 Extracts all red features (hex #FF0000) from a page of a PDF.
@@ -64,43 +83,22 @@ Extracts all red features (hex #FF0000) from a page of a PDF.
 Debug info prints examples of every feature and color for convenience.
 '''
 def extract_red_features(page, debug=False):
-    red_color = (1.0, 0.0, 0.0)
-    drawings = page.get_drawings()
-    features = {
-        's': [],
-        'f': [],
-        'fs': []
-    }
+    drawings = get_drawings(page)
+    buckets = {item_type: match(color=RED, types=item_type) for item_type in ['s', 'f', 'fs']}
+    scan = scan_drawings(drawings, buckets)
+    features = scan['buckets']
     
-    colors = set()
-    types = set()
-    examples = []
-    
-    for item in drawings:
-        
-        item_type = item['type']
-        if item_type not in types:
-            examples.append(item)
-        types.add(item_type)
-        
-        color = None
-        if item['type'] == 's':
-            color = item.get("color")
-        elif item['type'] == 'f':
-            color = item.get("fill")
-        elif item['type'] == 'fs':
-            color = item.get("color")
-            
-        colors.add(color)
+    def print_debug():
+        colors = {color for item_type, color in scan['histogram']}
+        types = {item_type for item_type, color in scan['histogram']}
+        examples = {}
+        for (item_type, color), example in scan['examples'].items():
+            examples.setdefault(item_type, example)
         
-        if color and tuple(color) == red_color:
-            features[item_type].append(item)
-    
-    def print_debug():         
         print("Colors:", colors)
         print("Types:", types)
         print("Type examples:")
-        for e in examples:
+        for e in examples.values():
             print()
             print(e)
     
@@ -111,22 +109,42 @@ def extract_red_features(page, debug=False):
 
 '''
 Converts a list of PDF drawings into a valid JSON object.
+
+Every PyMuPDF item type is kept: lines as ['l', p1, p2], rects as ['re', [x0, y0, x1, y1]]
+and quads as ['qu', [ul, ur, ll, lr]]. Curves are flattened into 'l' segments that stay
+within tolerance (PDF points) of the curve, or kept as ['c', p1, p2, p3, p4] if tolerance
+is None. With dots=True, drawings that are small circles are stored as 'dot': [x, y, radius]
+with no items instead of their outline.
 '''
-def jsonify_features(features):
+def jsonify_features(features, tolerance=0.1, dots=False):
     def convert_point(point):
-        return [point.x, point.y]
+        return [point[0], point[1]]
     
     def convert_item(item):
         kind = item[0]
         if kind == 'l':
-            kind, point1, point2 = item
-            return [kind, convert_point(point1), convert_point(point2)]
+            kind, point1, point2 = item[:3]
+            return [[kind, convert_point(point1), convert_point(point2)]]
+        elif kind == 'c':
+            if tolerance is None:
+                return [[kind, *[convert_point(point) for point in item[1:5]]]]
+            points = flatten_bezier(*item[1:5], tolerance)
+            return [['l', convert_point(a), convert_point(b)] for a, b in zip(points, points[1:])]
+        elif kind == 're':
+            return [[kind, list(item[1])]]
+        elif kind == 'qu':
+            return [[kind, [convert_point(point) for point in item[1]]]]
         else:
-            print(item)
-            return ['unknown', []]
+            return [['unknown', []]]
         
     def convert(stroke):
-        stroke['items'] = [convert_item(i) for i in stroke['items']]
+        dot = dot_geometry(stroke['items']) if dots else None
+        if dot:
+            center, radius = dot
+            stroke['items'] = []
+            stroke['dot'] = [center[0], center[1], radius]
+        else:
+            stroke['items'] = [converted for i in stroke['items'] for converted in convert_item(i)]
         stroke['color'] = list(stroke['fill']) if stroke['type'] == 'f' else list(stroke['color'])
         stroke['lineCap'] = list(stroke['lineCap']) if stroke['lineCap'] else None
         stroke['rect'] = list(stroke['rect'])
@@ -135,9 +153,9 @@ def jsonify_features(features):
     return [convert(stroke) for stroke in features]
 
 '''
-Extract the red features from an input PDF.
+Extract the red features from an input PDF (tolerance and dots as in jsonify_features).
 '''
-def extract_features(pdf, outpath, page_num=1, debug=False):
+def extract_features(pdf, outpath, page_num=1, debug=False, tolerance=0.1, dots=False):
     doc = fitz.open(pdf)
     page = doc[page_num - 1]
     features = extract_red_features(page)
@@ -146,35 +164,94 @@ def extract_features(pdf, outpath, page_num=1, debug=False):
         print("features:")
         [print(k, len(v)) for k, v in features.items()]
         
-    json_data = jsonify_features(features['s'] + features['f'] + features['fs'])
-    with open(outpath, 'w') as f:
-        json.dump(json_data, f, indent=4)
-        if debug:
-            print(f"extracted features to {outpath} successfully")
+    json_data = jsonify_features(features['s'] + features['f'] + features['fs'], tolerance, dots)
+    
+    # A .geom path writes the compact binary store instead of JSON
+    if outpath.endswith('.geom'):
+        save_drawings(json_data, outpath)
+    else:
+        with open(outpath, 'w') as f:
+            json.dump(json_data, f, indent=4)
+    
+    if debug:
+        print(f"extracted features to {outpath} successfully")
 
 '''
-Draw a feature on the input canvas (height is canvas height in pixels)
+Load extracted features from either a features JSON file or a .geom store.
 '''
-def draw_feature(c, feature, width, height):
+def load_features(path):
+    if is_store(path):
+        return load_store(path)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Style the overlay PDFs have always been drawn in
+overlay_style = {'color': (0, 1, 0), 'alpha': 0.5, 'width': 0.5, 'line_join': 1}
+
+def set_stroke_style(c, style):
+    c.setStrokeColor(Color(*style['color'], alpha=style['alpha']))
+    c.setLineJoin(style['line_join'])
+    c.setLineWidth(style['width'])
+
+def feature_path(c, feature, height):
+    """
+    Build one path object holding every item of a feature (y flipped for reportlab).
+
+    Returns:
+    - (path, skipped) (tuple): The PDFPathObject and the number of items it couldn't draw.
+    """
+    path = c.beginPath()
+    current = None
+    skipped = 0
+    if feature.get('dot'):
+        x, y, radius = feature['dot']
+        path.circle(x, height - y, radius)
     for item in feature['items']:
-        if item[0] == 'l':  # Line
-            start = item[1]
-            end = item[2]
-            c.setStrokeColor(Color(*(0, 1, 0), alpha=0.5))
-            c.setLineJoin(1)
-            c.setLineWidth(0.5)
-            c.line(start[0], height - start[1], end[0], height - end[1])
+        kind = item[0]
+        if kind == 'l' or kind == 'c':
+            points = [(x, height - y) for x, y in item[1:]]
+            # Segments that continue from the last one don't need a new subpath
+            if points[0] != current:
+                path.moveTo(*points[0])
+            if kind == 'l':
+                path.lineTo(*points[1])
+            else:
+                path.curveTo(*points[1], *points[2], *points[3])
+            current = points[-1]
+        elif kind == 're':
+            x0, y0, x1, y1 = item[1]
+            path.rect(x0, height - y1, x1 - x0, y1 - y0)
+            current = None
+        elif kind == 'qu':
+            # Quad corners are upper left, upper right, lower left, lower right
+            ul, ur, ll, lr = [(x, height - y) for x, y in item[1]]
+            path.moveTo(*ul)
+            path.lineTo(*ur)
+            path.lineTo(*lr)
+            path.lineTo(*ll)
+            path.close()
+            current = None
         else:
-            print("Non-line item:\n",item)
-        # Add more cases here for other types of items if needed
+            skipped += 1
+    return path, skipped
+
+'''
+Draw a feature on the input canvas (height is canvas height in pixels)
+'''
+def draw_feature(c, feature, width, height, style=overlay_style):
+    set_stroke_style(c, style)
+    path, skipped = feature_path(c, feature, height)
+    c.drawPath(path, stroke=1, fill=0)
+    return skipped
 
 '''
-Draw the features at the input JSON path in a PDF
+Draw the features at the input JSON path in a PDF.
+style is a style dict like overlay_style, or a function from feature to style dict;
+features are grouped by style so the graphics state is only set once per group.
 '''
-def draw_from_json(json_path, output_path):
-    # Load the JSON data
-    with open(json_path, 'r') as f:
-        features = json.load(f)
+def draw_from_json(json_path, output_path, style=overlay_style):
+    # Load the JSON data (or a .geom store)
+    features = load_features(json_path)
 
     # Create a new PDF
     page_width = 48 * 72  # 3456 points
@@ -182,9 +259,23 @@ def draw_from_json(json_path, output_path):
     page_size = (page_width, page_height)
     c = canvas.Canvas(output_path, pagesize=page_size)
 
-    # Iterate through the features and draw them
+    groups = {}
     for feature in features:
-        draw_feature(c, feature, page_width, page_height)
+        feature_style = style(feature) if callable(style) else style
+        key = json.dumps(feature_style, sort_keys=True)
+        groups.setdefault(key, (feature_style, []))[1].append(feature)
+
+    # Set the graphics state once per group, then draw each feature as a single path
+    skipped = 0
+    for group_style, group in groups.values():
+        set_stroke_style(c, group_style)
+        for feature in group:
+            path, feature_skipped = feature_path(c, feature, page_height)
+            c.drawPath(path, stroke=1, fill=0)
+            skipped += feature_skipped
+
+    if skipped:
+        print(f"Skipped {skipped} items that couldn't be drawn")
 
     # Save the PDF
     c.showPage()
@@ -247,6 +338,64 @@ def pdf_to_geo_old(bounds, x, y, rotation=None):
     
     return lat, lon
 
+def pdf_to_geo_old_affine(bounds, rotation=None):
+    """
+    Build the affine transform used by pdf_to_geo_old as a matrix and offset.
+
+    Args:
+    - bounds (dict): A dictionary containing the bounds information.
+    - rotation (float): Optional rotation in radians (same meaning as pdf_to_geo_old).
+
+    Returns:
+    - (matrix, offset) (tuple): 2x2 matrix and length-2 offset mapping [x, y] to [lon, lat].
+    """
+    x_min, x_max = bounds['x']
+    y_min, y_max = bounds['y']
+    lat_min, lat_max = bounds['lat']
+    lon_min, lon_max = bounds['lon']
+    
+    x_scale = 1 / (x_max - x_min)
+    y_scale = 1 / (y_max - y_min)
+    
+    if rotation:
+        # x maps to lat and the flipped y maps to lon before rotating about the center
+        scale = np.array([[(lat_max - lat_min) * x_scale, 0],
+                          [0, -(lon_max - lon_min) * y_scale]])
+        offset = np.array([lat_min - x_min * (lat_max - lat_min) * x_scale,
+                           lon_max + y_min * (lon_max - lon_min) * y_scale])
+        
+        center = np.array([(lat_min + lat_max) / 2, (lon_min + lon_max) / 2])
+        cos, sin = math.cos(rotation), math.sin(rotation)
+        rotate = np.array([[cos, -sin],
+                           [sin, cos]])
+        
+        # [lat, lon] = R (S p + o - c) + c
+        matrix = rotate @ scale
+        offset = rotate @ (offset - center) + center
+    else:
+        matrix = np.array([[0, (lat_max - lat_min) * y_scale],
+                           [(lon_max - lon_min) * x_scale, 0]])
+        offset = np.array([lat_min - y_min * (lat_max - lat_min) * y_scale,
+                           lon_min - x_min * (lon_max - lon_min) * x_scale])
+    
+    # Swap rows so the output is [lon, lat] (GeoJSON order)
+    return matrix[::-1], offset[::-1]
+
+def pdf_to_geo_old_array(bounds, coords, rotation=None):
+    """
+    Convert an array of PDF coordinates to geographic coordinates in one batch.
+    
+    Args:
+    - bounds (dict): A dictionary containing the bounds information.
+    - coords (array-like): (N, 2) array of PDF [x, y] coordinates.
+    - rotation (float): Optional rotation in radians (same meaning as pdf_to_geo_old).
+    
+    Returns:
+    - lon_lat (np.ndarray): (N, 2) array of [lon, lat] coordinates.
+    """
+    matrix, offset = pdf_to_geo_old_affine(bounds, rotation)
+    return np.asarray(coords, dtype=float).reshape(-1, 2) @ matrix.T + offset
+
 '''
 Converts PDF coordinates (as shown on the inspector) to latitude and longitude.
 Automatically handles y-coordinate inversion.
@@ -275,20 +424,65 @@ def pdf_to_geo(bounds, dimensions, x, y):
         'lat': lat,
         'lon': lon
     }
+
+'''
+Builds the affine transform used by pdf_to_geo as a 2x2 matrix and offset mapping [x, y] to [lon, lat].
+'''
+def pdf_to_geo_affine(bounds, dimensions):
+    height = dimensions['height']
+    width = dimensions['width']
+    lat_min, lat_max = bounds['lat']
+    lon_min, lon_max = bounds['lon']
     
-def features_to_geojson(features, bounds, dimensions, outfile):
-    # Convert PDF features to GeoJSON LineString features
-    geojson_features = []
+    # lon scales with x, lat scales with the inverted y
+    matrix = np.array([[(lon_max - lon_min) / width, 0],
+                       [0, -(lat_max - lat_min) / height]])
+    offset = np.array([lon_min, lat_max])
+    return matrix, offset
+
+'''
+Array version of pdf_to_geo: converts an (N, 2) array of PDF [x, y] coordinates
+to an (N, 2) array of [lon, lat] coordinates with a single matrix multiply.
+'''
+def pdf_to_geo_array(bounds, dimensions, coords):
+    matrix, offset = pdf_to_geo_affine(bounds, dimensions)
+    return np.asarray(coords, dtype=float).reshape(-1, 2) @ matrix.T + offset
+    
+'''
+Converts PDF features to GeoJSON LineString features, yielding them one at a time.
+Coordinates are converted batch_size features at a time, so only one batch of
+converted points is held in memory while the features are written. Features can be
+any iterable (a list, a GeometryStore or a generator).
+'''
+def geojson_line_features(features, bounds, dimensions, batch_size=1000):
+    features = iter(features)
+    while True:
+        batch = list(itertools.islice(features, batch_size))
+        if not batch:
+            break
+        yield from _geojson_line_batch(batch, bounds, dimensions)
 
+def _geojson_line_batch(features, bounds, dimensions):
+    # Gather every line endpoint so the batch is converted in one matrix multiply
+    points = []
+    counts = []
     for feature in features:
-        coordinates = []
+        count = 0
+        if feature.get('dot'):
+            points.append(feature['dot'][:2])
+            count += 1
         for item in feature['items']:
             if item[0] == 'l':  # Line
-                start_pdf, end_pdf = item[1], item[2]
-                start_geo = pdf_to_geo(bounds, dimensions, *start_pdf)
-                end_geo = pdf_to_geo(bounds, dimensions, *end_pdf)
-                coordinates.append((start_geo['lon'], start_geo['lat']))
-                coordinates.append((end_geo['lon'], end_geo['lat']))
+                points.append(item[1])
+                points.append(item[2])
+                count += 2
+        counts.append(count)
+    
+    geo_points = pdf_to_geo_array(bounds, dimensions, points).tolist()
+    offsets = np.cumsum([0] + counts)
+
+    for i, feature in enumerate(features):
+        coordinates = geo_points[offsets[i]:offsets[i + 1]]
         
         '''
         # Create GeoJSON LineString feature
@@ -315,25 +509,89 @@ def features_to_geojson(features, bounds, dimensions, outfile):
             }
         }
         '''
+        # Dots are a single center point
+        if feature.get('dot'):
+            geometry = {
+                "type": "Point",
+                "coordinates": coordinates[0]
+            }
+        else:
+            geometry = {
+                "type": "LineString",
+                "coordinates": coordinates
+            }
+        
         geojson_feature = {
             "type": "Feature",
-            "geometry": {
+            "geometry": geometry,
+            "properties": {}
+        }
+        yield geojson_feature
+
+'''
+Chains the line segments of all the PDF features into maximal polylines (see polylines.chain_segments)
+and yields them as GeoJSON features: closed rings become Polygons, everything else LineStrings,
+and dots (see jsonify_features) become Points. Snap is the endpoint matching tolerance in PDF points.
+'''
+def geojson_chained_features(features, bounds, dimensions, snap=0.05):
+    if isinstance(features, GeometryStore):
+        segments = features.segments().tolist()
+        dots = [drawing['dot'][:2] for drawing in features.properties if drawing.get('dot')]
+    else:
+        segments = [(item[1], item[2]) for feature in features for item in feature['items'] if item[0] == 'l']
+        dots = [feature['dot'][:2] for feature in features if feature.get('dot')]
+    chains = chain_segments(segments, snap)
+    
+    # Convert every chain vertex and dot center in one batch
+    points = [point for chain, closed in chains for point in chain] + dots
+    geo_points = pdf_to_geo_array(bounds, dimensions, points).tolist()
+    offsets = np.cumsum([0] + [len(chain) for chain, closed in chains])
+    
+    for i, (chain, closed) in enumerate(chains):
+        coordinates = geo_points[offsets[i]:offsets[i + 1]]
+        
+        if closed and len(coordinates) >= 4:
+            geometry = {
+                "type": "Polygon",
+                "coordinates": [coordinates]
+            }
+        else:
+            geometry = {
                 "type": "LineString",
                 "coordinates": coordinates
+            }
+            
+        yield {
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {}
+        }
+    
+    for coordinates in geo_points[offsets[-1]:]:
+        yield {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": coordinates
             },
             "properties": {}
         }
-        geojson_features.append(geojson_feature)
-
-    # Create the GeoJSON structure
-    geojson = {
-        "type": "FeatureCollection",
-        "features": geojson_features
-    }
 
-    # Save the GeoJSON data to a file
-    with open(outfile, 'w') as f:
-        json.dump(geojson, f, indent=4)
+'''
+Converts PDF features to GeoJSON and streams them to outfile.
+Output is compact unless an indent is given. With chain=True (the default) connected
+segments are joined into polylines and polygons; chain=False writes one LineString
+per PDF feature with every segment's endpoints. With compress=True (the default) .gz/.br
+copies are written next to outfile for the server.
+'''
+def features_to_geojson(features, bounds, dimensions, outfile, indent=None, chain=True, snap=0.05, precision=None, compress=True):
+    if chain:
+        geojson_features = geojson_chained_features(features, bounds, dimensions, snap)
+    else:
+        geojson_features = geojson_line_features(features, bounds, dimensions)
+    write_feature_collection(geojson_features, outfile, indent, precision)
+    if compress:
+        precompress(outfile)
 
     print(f"GeoJSON data written to {outfile}")
 
@@ -357,8 +615,8 @@ if __name__ == "__main__":
             'width': 3456
         }
         
-        with open(features_path, 'r') as f:
-            features = json.load(f)
-            features_to_geojson(features, bounds, dimensions, 'features.geojson')
+        features = load_features(features_path)
+        # 7 decimal places is about 1 cm, far finer than the PDF was drawn
+        features_to_geojson(features, bounds, dimensions, 'features.geojson', precision=7)
     
     update_geojson()
\ No newline at end of file
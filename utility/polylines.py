@@ -0,0 +1,90 @@
+'''
+Topology building for line segments extracted from PDF drawings.
+
+PDF drawings store outlines as many separate 'l' segments, often split across
+several strokes. chain_segments joins segments that share an endpoint into
+maximal polylines, so every shared vertex appears once and closed outlines
+come back as rings.
+'''
+
+def snap_key(point, snap):
+    return (round(point[0] / snap), round(point[1] / snap))
+
+def chain_segments(segments, snap=0.05):
+    """
+    Chain line segments into maximal polylines.
+
+    Endpoints are snapped to a grid of size snap and hashed, so segments whose ends
+    fall in the same grid cell are treated as connected, and repeated segments are
+    dropped. Chains run through vertices shared by exactly two segments and stop at
+    dead ends and junctions.
+
+    Args:
+    - segments (iterable): ((x0, y0), (x1, y1)) pairs.
+    - snap (float): Grid size used to match endpoints (same units as the points).
+
+    Returns:
+    - chains (list): (points, closed) tuples. points is a list of (x, y); when closed is
+      True the last point repeats the first.
+    """
+    # Snapped vertex -> first coordinate seen there, and vertex -> incident segment ids
+    vertices = {}
+    incident = {}
+    edges = []
+    seen = set()
+    for start, end in segments:
+        a = snap_key(start, snap)
+        b = snap_key(end, snap)
+        if a == b:
+            continue # zero-length after snapping
+        
+        # Outlines are often stroked more than once; keep one copy of each segment
+        key = (a, b) if a < b else (b, a)
+        if key in seen:
+            continue
+        seen.add(key)
+        
+        vertices.setdefault(a, (start[0], start[1]))
+        vertices.setdefault(b, (end[0], end[1]))
+        edge = len(edges)
+        edges.append((a, b))
+        incident.setdefault(a, []).append(edge)
+        incident.setdefault(b, []).append(edge)
+
+    used = [False] * len(edges)
+
+    def walk(vertex, edge):
+        # Follow edges from vertex until a dead end, a junction or a used edge
+        keys = [vertex]
+        while True:
+            used[edge] = True
+            a, b = edges[edge]
+            vertex = b if a == vertex else a
+            keys.append(vertex)
+
+            following = incident[vertex]
+            if len(following) != 2:
+                break
+            edge = following[0] if following[1] == edge else following[1]
+            if used[edge]:
+                break
+        return keys
+
+    chains = []
+
+    # Open chains start at vertices that aren't simple pass-throughs
+    for vertex, vertex_edges in incident.items():
+        if len(vertex_edges) == 2:
+            continue
+        for edge in vertex_edges:
+            if not used[edge]:
+                keys = walk(vertex, edge)
+                chains.append(([vertices[key] for key in keys], keys[0] == keys[-1]))
+
+    # Whatever is left is made of closed loops through degree-2 vertices
+    for edge, (a, b) in enumerate(edges):
+        if not used[edge]:
+            keys = walk(a, edge)
+            chains.append(([vertices[key] for key in keys], keys[0] == keys[-1]))
+
+    return chains
@@ -0,0 +1,101 @@
+import gzip
+import os
+import sys
+
+'''
+Pre-compressed copies of served layers.
+
+Every time a layer is written, precompress writes layer.gz next to it (and layer.br
+if the brotli module is installed) at the highest compression level. cors_server.py
+serves these copies to clients that accept them, so layers are compressed once per
+build instead of once per request. A copy only counts as fresh while it is at least
+as new as the layer it was made from.
+
+Usage:
+    python precompress.py [directory ...]
+
+compresses every .json and .geojson file in backend/data and tree_extractions
+(or the given directories).
+'''
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Layers smaller than this aren't worth compressing
+min_size = 1024
+
+layer_extensions = ('.json', '.geojson', '.topojson')
+
+def _compress(data, encoding):
+    if encoding == 'gz':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    raise ValueError(f"Encoding {encoding} not supported (supported: ['gz', 'br'])")
+
+def available_encodings():
+    return ['gz', 'br'] if brotli is not None else ['gz']
+
+def is_fresh(path, sibling):
+    return os.path.exists(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path)
+
+def precompress(path, encodings=None):
+    """
+    Write compressed siblings of a file (path.gz, path.br).
+
+    Args:
+    - path (str): File to compress.
+    - encodings (list): 'gz' and/or 'br' (defaults to every available encoding).
+
+    Returns:
+    - written (list): Paths of the siblings written.
+    """
+    if encodings is None:
+        encodings = available_encodings()
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    written = []
+    for encoding in encodings:
+        sibling = f'{path}.{encoding}'
+        if len(data) < min_size:
+            # Don't leave a stale copy of an older, bigger version behind
+            if os.path.exists(sibling):
+                os.remove(sibling)
+            continue
+
+        # Write to a temporary file first so the server never sees half a file
+        tmp_path = f'{sibling}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_compress(data, encoding))
+        os.replace(tmp_path, sibling)
+        written.append(sibling)
+
+    return written
+
+def precompress_dir(directory, encodings=None, force=False):
+    """
+    Compress every layer in a directory whose siblings are missing or out of date.
+    """
+    if encodings is None:
+        encodings = available_encodings()
+
+    written = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path) or not name.endswith(layer_extensions):
+            continue
+        if force or not all(is_fresh(path, f'{path}.{encoding}') for encoding in encodings):
+            written.extend(precompress(path, encodings))
+    return written
+
+if __name__ == "__main__":
+    directories = sys.argv[1:] or ['../backend/data', 'tree_extractions']
+    if brotli is None:
+        print("brotli module not installed, writing .gz only")
+    for directory in directories:
+        for sibling in precompress_dir(directory):
+            print(f"{sibling}: {os.path.getsize(sibling)} bytes")
@@ -0,0 +1,13 @@
+import numpy as np
+from clean_coords import douglas_peucker
+
+def test_douglas_peucker_keeps_line_doubling_back():
+    # The third point lies 5 m behind the start, along the chord's own line
+    points = np.array([[0, 0], [10, 0], [-5, 0.1], [5, 0.2]], dtype=float)
+    keep = douglas_peucker(points, 0.5)
+    assert keep.tolist() == [True, True, True, True]
+
+def test_douglas_peucker_drops_points_near_chord():
+    points = np.array([[0, 0], [2, 0.1], [5, -0.1], [10, 0]], dtype=float)
+    keep = douglas_peucker(points, 0.5)
+    assert keep.tolist() == [True, False, False, True]
@@ -0,0 +1,28 @@
+import json
+import pytest
+from geometry_store import load_store, save_drawings
+from pdf_utils import features_to_geojson
+
+bounds = {'lon': (-71.588187, -71.568522), 'lat': (43.187356, 43.198032)}
+dimensions = {'width': 2592, 'height': 3456}
+
+drawings = [
+    {'items': [['l', [0, 0], [10, 0]], ['l', [10, 0], [10, 10]]], 'color': [1, 0, 0]},
+    {'items': [['l', [20, 20], [30, 25]]], 'color': [1, 0, 0]},
+    {'items': [], 'dot': [5, 5, 1], 'color': [1, 0, 0]},
+]
+
+@pytest.mark.parametrize('chain', [True, False])
+def test_features_to_geojson_from_store(tmp_path, chain):
+    # A store gives the same GeoJSON as the drawings list it was saved from
+    store_path = str(tmp_path / 'drawings.geom')
+    save_drawings(drawings, store_path)
+
+    from_list = tmp_path / 'from_list.geojson'
+    from_store = tmp_path / 'from_store.geojson'
+    features_to_geojson(drawings, bounds, dimensions, str(from_list), chain=chain, compress=False)
+    features_to_geojson(load_store(store_path), bounds, dimensions, str(from_store), chain=chain, compress=False)
+
+    expected = json.loads(from_list.read_text())
+    assert json.loads(from_store.read_text()) == expected
+    assert len(expected['features']) > 0
@@ -0,0 +1,335 @@
+import json
+import math
+import os
+from clean_coords import simplify_features
+from geojson_writer import FeatureCollectionWriter
+from lod_export import layer_latitude, tolerance_for_zoom
+
+'''
+Offline z/x/y tile pyramid generator for GeoJSON layers.
+
+Each layer is simplified for every zoom level (about one pixel of tolerance), then
+cut into Web Mercator tiles with per-tile clipping: lines are clipped segment by
+segment and polygon rings are clipped against the tile box. Tiles are written to
+disk as {outdir}/{layer}/{z}/{x}/{y}.geojson (or .mvt) for static serving, together
+with a TileJSON file describing the pyramid.
+
+MVT output needs the optional mapbox_vector_tile package; GeoJSON tiles need
+nothing extra.
+
+Usage:
+    generate_tiles('../backend/data/trees.json', 'tiles', min_zoom=14, max_zoom=18)
+'''
+
+# Buffer around each tile, as a fraction of the tile size, so lines don't end exactly on tile edges
+default_buffer = 1 / 64
+
+MVT_EXTENT = 4096
+
+def lonlat_to_world(lon, lat):
+    # Web Mercator, scaled so the world is the unit square with y pointing down
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lon + 180) / 360
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2
+    return (x, y)
+
+def world_to_lonlat(x, y):
+    lon = x * 360 - 180
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return [lon, lat]
+
+def _inside(point, edge, box):
+    x0, y0, x1, y1 = box
+    return (point[0] >= x0, point[1] >= y0, point[0] <= x1, point[1] <= y1)[edge]
+
+def _intersect(a, b, edge, box):
+    # Where segment a-b crosses one edge of the box
+    value = box[edge]
+    if edge in (0, 2):
+        t = (value - a[0]) / (b[0] - a[0])
+        return (value, a[1] + t * (b[1] - a[1]))
+    t = (value - a[1]) / (b[1] - a[1])
+    return (a[0] + t * (b[0] - a[0]), value)
+
+def clip_ring(ring, box):
+    """
+    Clip a closed ring to a box (Sutherland-Hodgman). Returns a closed ring or None.
+    """
+    points = ring[:-1] if ring and ring[0] == ring[-1] else ring
+    for edge in range(4):
+        if not points:
+            return None
+        clipped = []
+        previous = points[-1]
+        for point in points:
+            if _inside(point, edge, box):
+                if not _inside(previous, edge, box):
+                    clipped.append(_intersect(previous, point, edge, box))
+                clipped.append(point)
+            elif _inside(previous, edge, box):
+                clipped.append(_intersect(previous, point, edge, box))
+            previous = point
+        points = clipped
+
+    if len(points) < 3:
+        return None
+    return points + [points[0]]
+
+def _clip_segment(a, b, box):
+    # Liang-Barsky: returns the part of segment a-b inside the box, or None
+    x0, y0, x1, y1 = box
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, a[0] - x0), (dx, x1 - a[0]), (-dy, a[1] - y0), (dy, y1 - a[1])):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    start = a if t0 == 0 else (a[0] + t0 * dx, a[1] + t0 * dy)
+    end = b if t1 == 1 else (a[0] + t1 * dx, a[1] + t1 * dy)
+    return start, end
+
+def clip_line(points, box):
+    """
+    Clip a line to a box. Returns the list of parts that fall inside it.
+    """
+    if len(points) == 1:
+        return [points] if _point_in_box(points[0], box) else []
+
+    parts = []
+    current = None
+    for a, b in zip(points, points[1:]):
+        segment = _clip_segment(a, b, box)
+        if segment is None:
+            current = None
+            continue
+        start, end = segment
+        if current is not None and current[-1] == start:
+            current.append(end)
+        else:
+            current = [start, end]
+            parts.append(current)
+        if end != b:
+            current = None # left the box
+    return parts
+
+def _point_in_box(point, box):
+    return box[0] <= point[0] <= box[2] and box[1] <= point[1] <= box[3]
+
+def _to_world(geometry):
+    kind = geometry['type']
+    coordinates = geometry['coordinates']
+    if kind == 'Point':
+        return [lonlat_to_world(*coordinates[:2])]
+    if kind in ('MultiPoint', 'LineString'):
+        return [lonlat_to_world(*c[:2]) for c in coordinates]
+    if kind in ('MultiLineString', 'Polygon'):
+        return [[lonlat_to_world(*c[:2]) for c in part] for part in coordinates]
+    if kind == 'MultiPolygon':
+        return [[[lonlat_to_world(*c[:2]) for c in ring] for ring in polygon] for polygon in coordinates]
+    raise ValueError(f"Geometry type {kind} not supported")
+
+def _split_collections(features):
+    # Tiles (MVT in particular) have no GeometryCollection, so each member geometry
+    # becomes a feature of its own with the collection's properties
+    for feature in features:
+        geometry = feature.get('geometry')
+        if not geometry:
+            continue
+        if geometry['type'] == 'GeometryCollection':
+            parts = [{**feature, 'geometry': part} for part in geometry['geometries']]
+            yield from _split_collections(parts)
+        else:
+            yield feature
+
+def _flatten(kind, world):
+    if kind in ('Point', 'MultiPoint', 'LineString'):
+        return world
+    if kind in ('MultiLineString', 'Polygon'):
+        return [c for part in world for c in part]
+    return [c for polygon in world for ring in polygon for c in ring]
+
+def clip_geometry(kind, world, box):
+    """
+    Clip a geometry (in world coordinates) to a box.
+    Returns (type, world coordinates) or None if nothing is left.
+    """
+    if kind in ('Point', 'MultiPoint'):
+        points = [p for p in world if _point_in_box(p, box)]
+        if not points:
+            return None
+        return ('Point', points[0]) if kind == 'Point' else ('MultiPoint', points)
+
+    if kind in ('LineString', 'MultiLineString'):
+        lines = [world] if kind == 'LineString' else world
+        parts = [part for line in lines for part in clip_line(line, box) if len(part) >= 2]
+        if not parts:
+            return None
+        return ('LineString', parts[0]) if len(parts) == 1 else ('MultiLineString', parts)
+
+    polygons = [world] if kind == 'Polygon' else world
+    clipped = []
+    for polygon in polygons:
+        rings = [clip_ring(ring, box) for ring in polygon]
+        if rings and rings[0]:
+            clipped.append([ring for ring in rings if ring])
+    if not clipped:
+        return None
+    return ('Polygon', clipped[0]) if len(clipped) == 1 else ('MultiPolygon', clipped)
+
+def _map_coords(kind, coordinates, transform):
+    if kind == 'Point':
+        return transform(*coordinates)
+    if kind in ('MultiPoint', 'LineString'):
+        return [transform(*c) for c in coordinates]
+    if kind in ('MultiLineString', 'Polygon'):
+        return [[transform(*c) for c in part] for part in coordinates]
+    return [[[transform(*c) for c in ring] for ring in polygon] for polygon in coordinates]
+
+def _wkt(kind, coordinates):
+    def points(part):
+        return '(' + ', '.join(f'{x} {y}' for x, y in part) + ')'
+    if kind == 'Point':
+        return f'POINT ({coordinates[0]} {coordinates[1]})'
+    if kind in ('MultiPoint', 'LineString'):
+        return f'{kind.upper()} {points(coordinates)}'
+    if kind in ('MultiLineString', 'Polygon'):
+        return f'{kind.upper()} (' + ', '.join(points(part) for part in coordinates) + ')'
+    return 'MULTIPOLYGON (' + ', '.join('(' + ', '.join(points(ring) for ring in polygon) + ')' for polygon in coordinates) + ')'
+
+def _write_mvt(path, layer, tile_features, z, x, y):
+    try:
+        import mapbox_vector_tile
+    except ImportError:
+        raise ImportError("MVT tiles need the mapbox_vector_tile package (pip install mapbox-vector-tile)")
+
+    n = 2 ** z
+    def to_tile(wx, wy):
+        return (round((wx * n - x) * MVT_EXTENT), round((wy * n - y) * MVT_EXTENT))
+
+    features = []
+    for kind, world, properties in tile_features:
+        # MVT properties must be scalars
+        properties = {k: (v if isinstance(v, (str, int, float, bool)) else json.dumps(v)) for k, v in properties.items() if v is not None}
+        features.append({'geometry': _wkt(kind, _map_coords(kind, world, to_tile)), 'properties': properties})
+
+    data = mapbox_vector_tile.encode([{'name': layer, 'features': features}],
+                                     default_options={'y_coord_down': True, 'extents': MVT_EXTENT})
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _write_geojson(path, tile_features, indent=None):
+    with FeatureCollectionWriter(path, indent) as writer:
+        for kind, world, properties in tile_features:
+            writer.write({
+                "type": "Feature",
+                "geometry": {"type": kind, "coordinates": _map_coords(kind, world, world_to_lonlat)},
+                "properties": properties
+            })
+
+def generate_tiles(layer_path, outdir, min_zoom=14, max_zoom=18, format='geojson', buffer=default_buffer, pixels=1.0, mode='dp'):
+    """
+    Cut a GeoJSON layer into a z/x/y tile pyramid on disk.
+
+    Args:
+    - layer_path (str): GeoJSON FeatureCollection to tile.
+    - outdir (str): Root directory; tiles go in {outdir}/{layer}/{z}/{x}/{y}.{format}.
+    - min_zoom, max_zoom (int): Zoom range to generate (inclusive). max_zoom is not simplified.
+    - format (str): 'geojson' or 'mvt'.
+    - buffer (float): Extra margin around each tile as a fraction of the tile size.
+    - pixels (float): Simplification tolerance in screen pixels.
+    - mode (str): Simplification mode, 'dp' or 'vw' (see clean_coords).
+
+    Features without geometry are left out, and a GeometryCollection is tiled as one
+    feature per member geometry.
+
+    Returns:
+    - stats (dict): Number of tiles written per zoom level.
+    """
+    if format not in ('geojson', 'mvt'):
+        raise ValueError(f"Tile format {format} not supported (supported: geojson, mvt)")
+
+    with open(layer_path, 'r') as f:
+        features = list(_split_collections(json.load(f)['features']))
+
+    layer = os.path.splitext(os.path.basename(layer_path))[0]
+    lat = layer_latitude(features)
+    stats = {}
+    world_bounds = None # [min x, min y, max x, max y] in world coordinates
+
+    for z in range(min_zoom, max_zoom + 1):
+        n = 2 ** z
+        zoom_features = features
+        if z < max_zoom:
+            zoom_features = simplify_features(features, tolerance_for_zoom(z, lat, pixels), mode)
+
+        # Route each clipped feature to every tile its bounding box touches
+        tiles = {}
+        for feature in zoom_features:
+            kind = feature['geometry']['type']
+            world = _to_world(feature['geometry'])
+            flat = _flatten(kind, world)
+            if not flat:
+                continue
+
+            min_x = min(p[0] for p in flat)
+            max_x = max(p[0] for p in flat)
+            min_y = min(p[1] for p in flat)
+            max_y = max(p[1] for p in flat)
+            pad = buffer / n
+            
+            if world_bounds is None:
+                world_bounds = [min_x, min_y, max_x, max_y]
+            else:
+                world_bounds = [min(world_bounds[0], min_x), min(world_bounds[1], min_y),
+                                max(world_bounds[2], max_x), max(world_bounds[3], max_y)]
+
+            for x in range(max(int((min_x - pad) * n), 0), min(int((max_x + pad) * n), n - 1) + 1):
+                for y in range(max(int((min_y - pad) * n), 0), min(int((max_y + pad) * n), n - 1) + 1):
+                    box = (x / n - pad, y / n - pad, (x + 1) / n + pad, (y + 1) / n + pad)
+                    clipped = clip_geometry(kind, world, box)
+                    if clipped:
+                        tiles.setdefault((x, y), []).append((*clipped, feature.get('properties') or {}))
+
+        for (x, y), tile_features in tiles.items():
+            tile_dir = os.path.join(outdir, layer, str(z), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            path = os.path.join(tile_dir, f'{y}.{format}')
+            if format == 'mvt':
+                _write_mvt(path, layer, tile_features, z, x, y)
+            else:
+                _write_geojson(path, tile_features)
+
+        stats[z] = len(tiles)
+
+    # TileJSON so clients know where the tiles are and which zooms exist
+    tilejson = {
+        "tilejson": "3.0.0",
+        "name": layer,
+        "tiles": [f"{layer}/{{z}}/{{x}}/{{y}}.{format}"],
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+    }
+    if world_bounds:
+        west, south = world_to_lonlat(world_bounds[0], world_bounds[3])
+        east, north = world_to_lonlat(world_bounds[2], world_bounds[1])
+        tilejson["bounds"] = [west, south, east, north]
+    with open(os.path.join(outdir, f'{layer}.tilejson'), 'w') as f:
+        json.dump(tilejson, f, indent=2)
+
+    return stats
+
+if __name__ == "__main__":
+    for name in ['trees', 'trails', 'buildings', 'flowerBeds']:
+        stats = generate_tiles(f'../backend/data/{name}.json', '../backend/tiles')
+        print(name, stats)
@@ -0,0 +1,318 @@
+import json
+import os
+
+'''
+TopoJSON output for GeoJSON layers.
+
+Coordinates are quantized to an integer grid over the layer's bounding box, lines and
+rings are cut wherever they meet other geometry, and each resulting arc is stored once
+(shared edges between neighbouring beds or buildings are referenced forwards by one
+feature and backwards, as ~index, by the other). Arcs are delta-encoded, so most
+positions are small integers. Map apps can read the result with topojson-client
+(topojson.feature(topology, topology.objects[name])).
+
+Usage:
+    write_topology(geojson_data['features'], 'flowerBeds.topojson', name='flowerBeds')
+'''
+
+def _bbox(features):
+    xs = []
+    ys = []
+    for feature in features:
+        for line in _geometry_lines(feature.get('geometry')):
+            xs.extend(position[0] for position in line)
+            ys.extend(position[1] for position in line)
+    if not xs:
+        return [0, 0, 0, 0]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+def _geometry_lines(geometry):
+    # Every list of positions in a geometry (points count as one-position lines)
+    if geometry is None:
+        return []
+    kind = geometry['type']
+    coordinates = geometry['coordinates']
+    if kind == 'Point':
+        return [[coordinates]]
+    if kind in ('MultiPoint', 'LineString'):
+        return [coordinates]
+    if kind in ('MultiLineString', 'Polygon'):
+        return coordinates
+    if kind == 'MultiPolygon':
+        return [ring for polygon in coordinates for ring in polygon]
+    raise ValueError(f"Geometry type {kind} not supported (supported: Point, MultiPoint, LineString, MultiLineString, Polygon, MultiPolygon)")
+
+class _Quantizer:
+    def __init__(self, bbox, quantization):
+        x0, y0, x1, y1 = bbox
+        self.translate = [x0, y0]
+        self.scale = [
+            (x1 - x0) / (quantization - 1) if x1 > x0 else 1,
+            (y1 - y0) / (quantization - 1) if y1 > y0 else 1,
+        ]
+
+    def point(self, position):
+        return (round((position[0] - self.translate[0]) / self.scale[0]),
+                round((position[1] - self.translate[1]) / self.scale[1]))
+
+    def line(self, positions):
+        # Quantize, dropping positions that land on the same grid cell as the one before
+        points = []
+        for position in positions:
+            point = self.point(position)
+            if not points or point != points[-1]:
+                points.append(point)
+        return points
+
+def _find_junctions(lines, rings):
+    """
+    Points where geometries meet: line ends, and points reached from different
+    neighbours by different lines or rings.
+    """
+    neighbours = {}
+    junctions = set()
+
+    def visit(point, before, after):
+        seen = neighbours.get(point)
+        if seen is None:
+            neighbours[point] = (before, after)
+        elif seen != (before, after) and seen != (after, before):
+            junctions.add(point)
+
+    for line in lines:
+        junctions.add(line[0])
+        junctions.add(line[-1])
+        for i in range(1, len(line) - 1):
+            visit(line[i], line[i - 1], line[i + 1])
+
+    for ring in rings:
+        points = ring[:-1]
+        for i, point in enumerate(points):
+            visit(point, points[i - 1], points[(i + 1) % len(points)])
+
+    return junctions
+
+def _cut(points, junctions):
+    # Split a line at every junction along its interior
+    arcs = []
+    start = 0
+    for i in range(1, len(points) - 1):
+        if points[i] in junctions:
+            arcs.append(points[start:i + 1])
+            start = i
+    arcs.append(points[start:])
+    return arcs
+
+def _cut_ring(ring, junctions):
+    points = ring[:-1]
+    starts = [i for i, point in enumerate(points) if point in junctions]
+    if not starts:
+        # No junctions: start at the smallest point so the same ring always gives the same arc
+        start = points.index(min(points))
+        return [points[start:] + points[:start + 1]]
+
+    start = starts[0]
+    return _cut(points[start:] + points[:start + 1], junctions)
+
+class _ArcIndex:
+    # Arcs stored once; a reversed copy of a known arc is referenced as ~index
+    def __init__(self):
+        self.arcs = []
+        self.index = {}
+
+    def add(self, arc):
+        key = tuple(arc)
+        if key in self.index:
+            return self.index[key]
+        reverse = key[::-1]
+        if reverse in self.index:
+            return ~self.index[reverse]
+
+        self.index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return self.index[key]
+
+def _delta_encode(arc):
+    encoded = [list(arc[0])]
+    for (x0, y0), (x1, y1) in zip(arc, arc[1:]):
+        encoded.append([x1 - x0, y1 - y0])
+    return encoded
+
+def features_to_topology(features, quantization=1e5, name='features'):
+    """
+    Convert GeoJSON features to a quantized, delta-encoded TopoJSON topology.
+
+    Args:
+    - features (list): GeoJSON features.
+    - quantization (float): Grid size along each axis of the layer's bounding box
+      (1e5 is about 2 cm across the campus).
+    - name (str): Name of the object holding the features.
+
+    Returns:
+    - topology (dict): A TopoJSON Topology.
+    """
+    features = list(features)
+    bbox = _bbox(features)
+    quantizer = _Quantizer(bbox, quantization)
+
+    # Quantize everything first, so junctions are found on the grid the arcs are stored on
+    quantized = []
+    lines = []
+    rings = []
+    for feature in features:
+        geometry = feature.get('geometry')
+        if geometry is None:
+            quantized.append(None)
+            continue
+
+        kind = geometry['type']
+        coordinates = geometry['coordinates']
+        if kind == 'Point':
+            parts = quantizer.point(coordinates)
+        elif kind == 'MultiPoint':
+            parts = [quantizer.point(position) for position in coordinates]
+        elif kind == 'LineString':
+            parts = [quantizer.line(coordinates)]
+            lines.extend(parts)
+        elif kind == 'MultiLineString':
+            parts = [quantizer.line(line) for line in coordinates]
+            lines.extend(parts)
+        elif kind == 'Polygon':
+            parts = [[quantizer.line(ring) for ring in coordinates]]
+            rings.extend(parts[0])
+        elif kind == 'MultiPolygon':
+            parts = [[quantizer.line(ring) for ring in polygon] for polygon in coordinates]
+            rings.extend(ring for polygon in parts for ring in polygon)
+        else:
+            raise ValueError(f"Geometry type {kind} not supported (supported: Point, MultiPoint, LineString, MultiLineString, Polygon, MultiPolygon)")
+        quantized.append(parts)
+
+    # Lines that collapsed to one grid cell still need two positions; empty lines get no arcs
+    for line in lines:
+        if len(line) == 1:
+            line.append(line[0])
+    lines = [line for line in lines if line]
+    rings = [ring for ring in rings if len(ring) >= 4]
+
+    junctions = _find_junctions(lines, rings)
+    arc_index = _ArcIndex()
+
+    def line_arcs(line):
+        return [arc_index.add(arc) for arc in _cut(line, junctions)] if line else []
+
+    def polygon_arcs(polygon):
+        # Rings that collapsed on the grid are dropped
+        return [[arc_index.add(arc) for arc in _cut_ring(ring, junctions)] for ring in polygon if len(ring) >= 4]
+
+    geometries = []
+    for feature, parts in zip(features, quantized):
+        if parts is None:
+            geometry = {'type': None}
+        else:
+            kind = feature['geometry']['type']
+            geometry = {'type': kind}
+            if kind == 'Point':
+                geometry['coordinates'] = list(parts)
+            elif kind == 'MultiPoint':
+                geometry['coordinates'] = [list(point) for point in parts]
+            elif kind == 'LineString':
+                geometry['arcs'] = line_arcs(parts[0])
+            elif kind == 'MultiLineString':
+                geometry['arcs'] = [line_arcs(line) for line in parts]
+            elif kind == 'Polygon':
+                geometry['arcs'] = polygon_arcs(parts[0])
+            else:
+                geometry['arcs'] = [polygon_arcs(polygon) for polygon in parts]
+
+        if 'id' in feature:
+            geometry['id'] = feature['id']
+        if feature.get('properties'):
+            geometry['properties'] = feature['properties']
+        geometries.append(geometry)
+
+    return {
+        'type': 'Topology',
+        'bbox': bbox,
+        'transform': {'scale': quantizer.scale, 'translate': quantizer.translate},
+        'objects': {name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': [_delta_encode(arc) for arc in arc_index.arcs],
+    }
+
+def topology_to_features(topology, name=None):
+    """
+    Decode a topology written by features_to_topology back into GeoJSON features
+    (coordinates come back snapped to the quantization grid).
+    """
+    scale = topology['transform']['scale']
+    translate = topology['transform']['translate']
+
+    def position(point):
+        return [point[0] * scale[0] + translate[0], point[1] * scale[1] + translate[1]]
+
+    arcs = []
+    for encoded in topology['arcs']:
+        x = y = 0
+        arc = []
+        for dx, dy in encoded:
+            x += dx
+            y += dy
+            arc.append(position((x, y)))
+        arcs.append(arc)
+
+    def line(indices):
+        positions = []
+        for i in indices:
+            arc = arcs[i] if i >= 0 else arcs[~i][::-1]
+            # Consecutive arcs share their end and start position
+            positions.extend(arc if not positions else arc[1:])
+        return positions
+
+    if name is None:
+        name = next(iter(topology['objects']))
+
+    features = []
+    for geometry in topology['objects'][name]['geometries']:
+        kind = geometry['type']
+        if kind is None:
+            feature_geometry = None
+        elif kind == 'Point':
+            feature_geometry = {'type': kind, 'coordinates': position(geometry['coordinates'])}
+        elif kind == 'MultiPoint':
+            feature_geometry = {'type': kind, 'coordinates': [position(point) for point in geometry['coordinates']]}
+        elif kind == 'LineString':
+            feature_geometry = {'type': kind, 'coordinates': line(geometry['arcs'])}
+        elif kind in ('MultiLineString', 'Polygon'):
+            feature_geometry = {'type': kind, 'coordinates': [line(part) for part in geometry['arcs']]}
+        else:
+            feature_geometry = {'type': kind, 'coordinates': [[line(ring) for ring in polygon] for polygon in geometry['arcs']]}
+
+        feature = {'type': 'Feature', 'geometry': feature_geometry, 'properties': geometry.get('properties', {})}
+        if 'id' in geometry:
+            feature['id'] = geometry['id']
+        features.append(feature)
+
+    return features
+
+'''
+Write GeoJSON features to a compact TopoJSON file and return the topology.
+'''
+def write_topology(features, path, quantization=1e5, name=None):
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    topology = features_to_topology(features, quantization, name)
+    with open(path, 'w') as f:
+        json.dump(topology, f, separators=(',', ':'))
+    return topology
+
+if __name__ == "__main__":
+    data_dir = '../backend/data'
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json'):
+            continue
+        layer_path = os.path.join(data_dir, filename)
+        with open(layer_path, 'r') as f:
+            features = json.load(f)['features']
+
+        topology_path = os.path.splitext(layer_path)[0] + '.topojson'
+        topology = write_topology(features, topology_path)
+        print(f"{filename}: {os.path.getsize(layer_path)} -> {os.path.getsize(topology_path)} bytes, {len(topology['arcs'])} arcs")